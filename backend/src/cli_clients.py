@@ -3,11 +3,11 @@
 from __future__ import annotations
 
 import asyncio
-import json
 import random
-import re
+import shutil
 from typing import Any, Callable, Optional, Sequence
 
+import orjson
 from autogen_core import CancellationToken, FunctionCall
 from autogen_core.models import (
     AssistantMessage,
@@ -26,6 +26,10 @@ from autogen_core.models import (
 DEFAULT_GEMINI_MODEL = "gemini-2.5-flash"
 
 
+class CliProcessError(RuntimeError):
+    """The CLI ran but reported a failure (non-zero exit or an API error); usually worth retrying."""
+
+
 def _render_user_content(content: str | Sequence[Any]) -> str:
     if isinstance(content, str):
         return content
@@ -57,6 +61,10 @@ def _format_messages(messages: Sequence[LLMMessage]) -> str:
     return "\n".join(lines)
 
 
+def _estimate_tokens(prompt: str) -> int:
+    return max(len(prompt) // 4, 1)
+
+
 class CLIChatCompletionClient(ChatCompletionClient):
     """Generic CLI-backed chat completion client."""
 
@@ -152,8 +160,7 @@ class CLIChatCompletionClient(ChatCompletionClient):
         )
 
     def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Any] = ()) -> int:
-        prompt = _format_messages(messages)
-        return max(len(prompt) // 4, 1)
+        return _estimate_tokens(_format_messages(messages))
 
     def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Any] = ()) -> int:
         estimated_limit = 131072
@@ -169,7 +176,7 @@ class CLIChatCompletionClient(ChatCompletionClient):
 
     async def _execute(self, messages: Sequence[LLMMessage]) -> tuple[str, RequestUsage]:
         prompt = _format_messages(messages)
-        argv = list(self._make_argv(prompt))
+        argv = self._make_argv(prompt)
 
         if self._debug:
             print("=== CLI debug ===")
@@ -183,26 +190,31 @@ class CLIChatCompletionClient(ChatCompletionClient):
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
         )
-        stdout_bytes, stderr_bytes = await proc.communicate()
-        stdout = stdout_bytes.decode("utf-8", errors="ignore")
-        stderr = stderr_bytes.decode("utf-8", errors="ignore")
+        # Output stays as bytes: orjson parses it directly and text is decoded only where it is shown.
+        stdout, stderr = await proc.communicate()
 
         if self._debug:
             print("Return code:", proc.returncode)
-            print("STDOUT:", stdout.strip()[:500])
-            print("STDERR:", stderr.strip()[:500])
+            print("STDOUT:", _decode(stdout).strip()[:500])
+            print("STDERR:", _decode(stderr).strip()[:500])
             print("=== End CLI debug ===")
 
         if proc.returncode != 0:
-            raise RuntimeError(stderr.strip() or stdout.strip() or f"CLI exited with {proc.returncode}")
+            raise CliProcessError(
+                _decode(stderr).strip() or _decode(stdout).strip() or f"CLI exited with {proc.returncode}"
+            )
 
-        text = self._parse_response(stdout, stderr)
+        text = self._parse_output(stdout, stderr)
         usage = RequestUsage(
-            prompt_tokens=self.count_tokens(messages),
+            prompt_tokens=_estimate_tokens(prompt),
             completion_tokens=max(len(text) // 4, 1) if text else 0,
         )
         return text, usage
 
+    def _parse_output(self, stdout: bytes, stderr: bytes) -> str:
+        """Decode the raw CLI output for ``parse_response``; built-in clients parse the bytes directly."""
+        return self._parse_response(_decode(stdout), _decode(stderr))
+
     def _record_usage(self, usage: RequestUsage) -> None:
         self._last_usage = usage
         self._prompt_tokens_total += usage.prompt_tokens
@@ -220,15 +232,13 @@ class GeminiCliChatCompletionClient(CLIChatCompletionClient):
         extra_flags: Sequence[str] | None = None,
         debug: bool = False,
     ) -> None:
-        extra_flags = list(extra_flags or [])
+        # Everything but the prompt is fixed per client, so build it once.
+        executable = _resolve_executable(cli_path)
+        prefix = (executable, "-m", model, "-p") if model else (executable, "-p")
+        suffix = ("-o", "json", *(extra_flags or ()))
 
         def make_argv(prompt: str) -> Sequence[str]:
-            argv: list[str] = [cli_path]
-            if model:
-                argv.extend(["-m", model])
-            argv.extend(["-p", prompt, "-o", "json"])
-            argv.extend(extra_flags)
-            return argv
+            return (*prefix, prompt, *suffix)
 
         super().__init__(
             make_argv=make_argv,
@@ -240,9 +250,13 @@ class GeminiCliChatCompletionClient(CLIChatCompletionClient):
 
     @staticmethod
     def _parse_response(stdout: str, stderr: str) -> str:
+        return GeminiCliChatCompletionClient._parse_output(stdout.encode("utf-8"), stderr.encode("utf-8"))
+
+    @staticmethod
+    def _parse_output(stdout: bytes, stderr: bytes) -> str:  # type: ignore[override]
         payload = _parse_json(stdout)
         if _payload_has_error(payload):
-            raise RuntimeError(
+            raise CliProcessError(
                 "Gemini CLI reported an API error. Check CLI stderr or /tmp/gemini-client-error-*.json for details."
             )
         return _extract_text_from_payload(payload, stdout)
@@ -262,22 +276,18 @@ class CodexCliChatCompletionClient(CLIChatCompletionClient):
         extra_flags: Sequence[str] | None = None,
         debug: bool = False,
     ) -> None:
-        output_flags = list(output_flags or [])
-        extra_flags = list(extra_flags or [])
-        subcommand = list(subcommand or [])
+        # Everything but the prompt is fixed per client, so build it once.
+        prefix = (
+            _resolve_executable(cli_path),
+            *(subcommand or ()),
+            *(("-m", model) if model else ()),
+            *(output_flags or ()),
+            *(extra_flags or ()),
+            *((prompt_flag,) if prompt_flag else ()),
+        )
 
         def make_argv(prompt: str) -> Sequence[str]:
-            argv: list[str] = [cli_path]
-            argv.extend(subcommand)
-            if model:
-                argv.extend(["-m", model])
-            argv.extend(output_flags)
-            argv.extend(extra_flags)
-            if prompt_flag:
-                argv.extend([prompt_flag, prompt])
-            else:
-                argv.append(prompt)
-            return argv
+            return (*prefix, prompt)
 
         super().__init__(
             make_argv=make_argv,
@@ -288,18 +298,24 @@ class CodexCliChatCompletionClient(CLIChatCompletionClient):
 
     @staticmethod
     def _parse_response(stdout: str, stderr: str) -> str:
+        return CodexCliChatCompletionClient._parse_output(stdout.encode("utf-8"), stderr.encode("utf-8"))
+
+    @staticmethod
+    def _parse_output(stdout: bytes, stderr: bytes) -> str:  # type: ignore[override]
         text = stdout.strip()
         if not text:
-            if stderr.strip():
-                raise RuntimeError(stderr.strip())
+            message = _decode(stderr).strip()
+            if message:
+                raise CliProcessError(message)
             return ""
 
-        lines = [line for line in text.splitlines() if line.strip()]
         agent_messages: list[str] = []
-        for line in lines:
+        for line in text.splitlines():
+            if not line.strip():
+                continue
             try:
-                payload = json.loads(line)
-            except json.JSONDecodeError:
+                payload = orjson.loads(line)
+            except orjson.JSONDecodeError:
                 continue
             if not isinstance(payload, dict):
                 continue
@@ -310,7 +326,7 @@ class CodexCliChatCompletionClient(CLIChatCompletionClient):
                     agent_messages.append(msg_text)
         if agent_messages:
             return "\n".join(agent_messages).strip()
-        return text
+        return _decode(text)
 
 
 class MockCliChatCompletionClient(ChatCompletionClient):
@@ -386,25 +402,25 @@ class MockCliChatCompletionClient(ChatCompletionClient):
         if prompt:
             try:
                 start = prompt.index("{")
-                payload = json.loads(prompt[start:])
-            except (ValueError, json.JSONDecodeError):
+                payload = orjson.loads(prompt[start:])
+            except ValueError:
                 payload = {}
         legal_actions = payload.get("legal_actions") if isinstance(payload, dict) else None
         if not isinstance(legal_actions, list) or not legal_actions:
-            return json.dumps({"action": "wait"})
+            return _dumps({"action": "wait"})
         non_wait = [entry for entry in legal_actions if entry.get("action") != "wait"]
         choice_pool = non_wait or legal_actions
         action = self._rng.choice(choice_pool)
         kind = action.get("action")
         if kind == "move":
             direction = action.get("direction", "up")
-            return json.dumps({"action": "move", "direction": direction})
+            return _dumps({"action": "move", "direction": direction})
         if kind == "talk":
             target = action.get("target", "ally")
             alias = action.get("target_title") or target
             message = f"Hey {alias}, let's keep moving!"
-            return json.dumps({"action": "talk", "target": target, "message": message})
-        return json.dumps({"action": "wait"})
+            return _dumps({"action": "talk", "target": target, "message": message})
+        return _dumps({"action": "wait"})
 
     async def close(self) -> None:
         return None
@@ -424,13 +440,26 @@ class MockCliChatCompletionClient(ChatCompletionClient):
         return self._model_info
 
 
-def _parse_json(raw_output: str) -> dict[str, Any]:
+def _dumps(value: Any) -> str:
+    return orjson.dumps(value).decode("utf-8")
+
+
+def _resolve_executable(cli_path: str) -> str:
+    """Look the CLI up on PATH once so each spawn execs an absolute path instead of searching."""
+    return shutil.which(cli_path) or cli_path
+
+
+def _decode(raw: bytes) -> str:
+    return raw.decode("utf-8", errors="ignore")
+
+
+def _parse_json(raw_output: bytes) -> dict[str, Any]:
     stripped = raw_output.strip()
     if not stripped:
         return {}
     try:
-        return json.loads(stripped)
-    except json.JSONDecodeError:
+        return orjson.loads(stripped)
+    except orjson.JSONDecodeError:
         return {}
 
 
@@ -448,10 +477,10 @@ def _payload_has_error(payload: dict[str, Any]) -> bool:
     return False
 
 
-def _extract_text_from_payload(payload: dict[str, Any], fallback: str) -> str:
+def _extract_text_from_payload(payload: dict[str, Any], fallback: bytes) -> str:
     candidates = payload.get("candidates")
     if isinstance(candidates, list) and candidates:
-        text_chunks = list(_walk_text(candidates[0]))
+        text_chunks = _walk_text(candidates[0])
         if text_chunks:
             return "".join(text_chunks).strip()
 
@@ -460,25 +489,25 @@ def _extract_text_from_payload(payload: dict[str, Any], fallback: str) -> str:
         if isinstance(value, str):
             return value.strip()
 
-    return fallback.strip()
+    return _decode(fallback).strip()
 
 
-def _walk_text(node: Any) -> Sequence[str]:
+def _walk_text(node: Any) -> list[str]:
+    """Collect text in document order: a dict's own ``text``, then its ``parts``, then ``content``."""
     chunks: list[str] = []
-
-    def _recurse(value: Any) -> None:
+    stack = [node]
+    while stack:
+        value = stack.pop()
         if isinstance(value, str):
             chunks.append(value)
         elif isinstance(value, list):
-            for item in value:
-                _recurse(item)
+            stack.extend(reversed(value))
         elif isinstance(value, dict):
-            if isinstance(value.get("text"), str):
-                chunks.append(value["text"])
-            if "parts" in value:
-                _recurse(value["parts"])
+            text = value.get("text")
+            if isinstance(text, str):
+                chunks.append(text)
             if "content" in value:
-                _recurse(value["content"])
-
-    _recurse(node)
+                stack.append(value["content"])
+            if "parts" in value:
+                stack.append(value["parts"])
     return chunks
@@ -1,14 +1,45 @@
 from __future__ import annotations
 
-from typing import Dict, Optional
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional, Sequence
+from uuid import uuid4
 
+import orjson
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 
 from sandbox_simulation import SandboxSimulation
 
-app = FastAPI(title="Sandbox Agent Simulator")
+
+# Sessions are kept in least-recently-used order; /reset evicts the oldest beyond MAX_SESSIONS
+# and any left idle for longer than SESSION_IDLE_SECONDS.
+MAX_SESSIONS = 32
+SESSION_IDLE_SECONDS = 30 * 60
+
+simulations: "OrderedDict[str, SandboxSimulation]" = OrderedDict()
+session_configs: Dict[str, Dict[str, object]] = {}
+session_last_used: Dict[str, float] = {}
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    yield
+    for simulation in simulations.values():
+        await simulation.close()
+    simulations.clear()
+    session_configs.clear()
+    session_last_used.clear()
+
+
+app = FastAPI(
+    title="Sandbox Agent Simulator",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,22 +49,61 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-simulation: Optional[SandboxSimulation] = None
-
 
 class ResetRequest(BaseModel):
+    session_id: Optional[str] = None
     grid_size: int = 3
     num_agents: int = 2
     seed: Optional[int] = None
     debug: bool = False
     backend: str = "gemini"
     player_agent: bool = False
+    plan_horizon: int = Field(default=1, ge=1)
+    cache_responses: bool = False
+    history_limit: int = Field(default=200, ge=0)
+    max_concurrent_queries: Optional[int] = Field(default=None, ge=1)
+    coalesce_agents: bool = False
 
 
 class PlayerActionRequest(BaseModel):
     action: Dict[str, object]
 
 
+def _get_simulation(session_id: str) -> SandboxSimulation:
+    simulation = simulations.get(session_id)
+    if simulation is None:
+        raise HTTPException(status_code=404, detail=f"Unknown session '{session_id}'. Call /reset first.")
+    _touch_session(session_id)
+    return simulation
+
+
+def _touch_session(session_id: str) -> None:
+    simulations.move_to_end(session_id)
+    session_last_used[session_id] = time.monotonic()
+
+
+def _drop_session(session_id: str) -> Optional[SandboxSimulation]:
+    session_configs.pop(session_id, None)
+    session_last_used.pop(session_id, None)
+    return simulations.pop(session_id, None)
+
+
+async def _evict_sessions(keep: str) -> None:
+    """Close idle sessions and the least recently used ones beyond ``MAX_SESSIONS``."""
+    now = time.monotonic()
+    evicted = []
+    for session_id in simulations:
+        if session_id == keep:
+            continue
+        over_capacity = len(simulations) - len(evicted) > MAX_SESSIONS
+        if over_capacity or now - session_last_used.get(session_id, now) > SESSION_IDLE_SECONDS:
+            evicted.append(session_id)
+    for session_id in evicted:
+        simulation = _drop_session(session_id)
+        if simulation is not None:
+            await simulation.close()
+
+
 @app.get("/health")
 async def health() -> dict[str, str]:
     return {"status": "ok"}
@@ -41,40 +111,113 @@ async def health() -> dict[str, str]:
 
 @app.post("/reset")
 async def reset(request: ResetRequest) -> dict[str, object]:
-    global simulation
-    simulation = SandboxSimulation(
-        num_agents=request.num_agents,
-        grid_size=request.grid_size,
-        debug=request.debug,
-        seed=request.seed,
-        backend=request.backend,
-        player_agent=request.player_agent,
-    )
-    snapshot = simulation.reset()
-    return {"status": "ok", "snapshot": snapshot, "playerAgent": request.player_agent}
+    session_id = request.session_id or uuid4().hex
+    config = request.model_dump(exclude={"session_id"})
+    previous = simulations.get(session_id)
+    if previous is not None and session_configs.get(session_id) == config:
+        # Same settings: keep the warm controllers, model client and response cache.
+        snapshot = previous.reset(reseed=True)
+        _touch_session(session_id)
+        await _evict_sessions(keep=session_id)
+        return {
+            "status": "ok",
+            "session_id": session_id,
+            "snapshot": snapshot,
+            "playerAgent": request.player_agent,
+        }
+    # Build the replacement before touching the old session, so invalid settings leave it intact.
+    try:
+        simulation = SandboxSimulation(
+            num_agents=request.num_agents,
+            grid_size=request.grid_size,
+            debug=request.debug,
+            seed=request.seed,
+            backend=request.backend,
+            player_agent=request.player_agent,
+            plan_horizon=request.plan_horizon,
+            cache_responses=request.cache_responses,
+            max_concurrent_queries=request.max_concurrent_queries,
+            history_limit=request.history_limit,
+            coalesce_agents=request.coalesce_agents,
+        )
+        snapshot = simulation.reset()
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if previous is not None:
+        _drop_session(session_id)
+        await previous.close()
+    simulations[session_id] = simulation
+    session_configs[session_id] = config
+    _touch_session(session_id)
+    await _evict_sessions(keep=session_id)
+    return {
+        "status": "ok",
+        "session_id": session_id,
+        "snapshot": snapshot,
+        "playerAgent": request.player_agent,
+    }
 
 
 @app.post("/step")
-async def step() -> dict[str, object]:
-    if simulation is None:
-        raise HTTPException(status_code=400, detail="Simulation not initialised. Call /reset first.")
+async def step(session_id: str) -> ORJSONResponse:
+    simulation = _get_simulation(session_id)
     result = await simulation.step()
-    return result
+    return ORJSONResponse(result)
 
 
 @app.post("/player_action")
-async def player_action(request: PlayerActionRequest) -> dict[str, object]:
-    if simulation is None:
-        raise HTTPException(status_code=400, detail="Simulation not initialised. Call /reset first.")
+async def player_action(session_id: str, request: PlayerActionRequest) -> ORJSONResponse:
+    simulation = _get_simulation(session_id)
     try:
         result = await simulation.apply_player_action(request.action)
     except (RuntimeError, ValueError) as exc:
         raise HTTPException(status_code=400, detail=str(exc))
-    return result
+    return ORJSONResponse(result)
 
 
 @app.get("/state")
-async def state() -> dict[str, object]:
+async def state(session_id: str, since: Optional[int] = None) -> StreamingResponse:
+    simulation = _get_simulation(session_id)
+    # Read the simulation here, on the event loop: StreamingResponse drains sync generators in a
+    # worker thread, where touching its caches could race with a concurrent step().
+    snapshot = simulation.snapshot_bytes()
+    history = simulation.history(since)
+    debug_log_url = f"/debug_log?session_id={session_id}" if simulation.debug else None
+    return StreamingResponse(_encode_state(snapshot, history, debug_log_url), media_type="application/json")
+
+
+def _encode_state(
+    snapshot: bytes, history: Sequence[Dict[str, object]], debug_log_url: Optional[str]
+) -> Iterator[bytes]:
+    """Stream the state payload one history entry at a time instead of encoding it in one go."""
+    yield b'{"snapshot":' + snapshot
+    if debug_log_url is not None:
+        yield b',"debugLog":' + orjson.dumps(debug_log_url)
+    yield b',"history":['
+    for index, entry in enumerate(history):
+        yield (b"," if index else b"") + orjson.dumps(entry)
+    yield b"]}"
+
+
+@app.get("/snapshot_delta")
+async def snapshot_delta(session_id: str, since: int) -> ORJSONResponse:
+    simulation = _get_simulation(session_id)
+    return ORJSONResponse(simulation.snapshot_delta(since))
+
+
+@app.get("/debug_log")
+async def debug_log(session_id: str, offset: int) -> dict[str, object]:
+    simulation = _get_simulation(session_id)
+    try:
+        return simulation.read_debug_log(offset)
+    except (RuntimeError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@app.delete("/session")
+async def close_session(session_id: str) -> dict[str, str]:
+    simulation = _drop_session(session_id)
     if simulation is None:
-        raise HTTPException(status_code=400, detail="Simulation not initialised. Call /reset first.")
-    return {"snapshot": simulation.snapshot(), "history": simulation.history()}
+        raise HTTPException(status_code=404, detail=f"Unknown session '{session_id}'.")
+    await simulation.close()
+    return {"status": "ok"}
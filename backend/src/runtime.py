@@ -0,0 +1,20 @@
+"""Event-loop entry point shared by the CLI scripts."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Coroutine, TypeVar
+
+try:
+    import uvloop
+except ImportError:  # uvicorn[standard] installs it everywhere except Windows
+    uvloop = None
+
+_T = TypeVar("_T")
+
+
+def run_event_loop(main: Coroutine[Any, Any, _T]) -> _T:
+    """Run an entry-point coroutine on uvloop when available, falling back to asyncio.run."""
+    if uvloop is not None:
+        return uvloop.run(main)
+    return asyncio.run(main)
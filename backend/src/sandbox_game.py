@@ -3,9 +3,9 @@
 from __future__ import annotations
 
 import argparse
-import asyncio
 from typing import Any, Dict
 
+from runtime import run_event_loop
 from sandbox_simulation import SandboxSimulation
 
 
@@ -18,6 +18,10 @@ async def run_simulation(
     seed: int | None = None,
     backend: str = "gemini",
     player_agent: bool = False,
+    plan_horizon: int = 1,
+    cache_responses: bool = False,
+    max_concurrent_queries: int | None = None,
+    coalesce_agents: bool = False,
 ) -> None:
     sim = SandboxSimulation(
         num_agents=num_agents,
@@ -26,6 +30,10 @@ async def run_simulation(
         seed=seed,
         backend=backend,
         player_agent=player_agent,
+        plan_horizon=plan_horizon,
+        cache_responses=cache_responses,
+        max_concurrent_queries=max_concurrent_queries,
+        coalesce_agents=coalesce_agents,
     )
     snapshot = sim.reset()
     print("=== Initial State ===")
@@ -74,6 +82,28 @@ def main() -> None:
         action="store_true",
         help="Include a player-controlled adventurer (last agent).",
     )
+    parser.add_argument(
+        "--plan-horizon",
+        type=int,
+        default=1,
+        help="Let each agent queue up to this many actions per LLM call.",
+    )
+    parser.add_argument(
+        "--cache-responses",
+        action="store_true",
+        help="Reuse LLM responses when an agent sees a board state it has seen before.",
+    )
+    parser.add_argument(
+        "--max-parallel",
+        type=int,
+        default=None,
+        help="Cap on concurrent LLM calls per turn (defaults to one per agent).",
+    )
+    parser.add_argument(
+        "--coalesce",
+        action="store_true",
+        help="Ask for every agent's action in a single LLM call per turn.",
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -81,7 +111,7 @@ def main() -> None:
     )
     args = parser.parse_args()
 
-    asyncio.run(
+    run_event_loop(
         run_simulation(
             num_agents=args.agents,
             grid_size=args.grid,
@@ -90,6 +120,10 @@ def main() -> None:
             seed=args.seed,
             backend=args.backend,
             player_agent=args.player,
+            plan_horizon=args.plan_horizon,
+            cache_responses=args.cache_responses,
+            max_concurrent_queries=args.max_parallel,
+            coalesce_agents=args.coalesce,
         )
     )
 
@@ -2,16 +2,25 @@
 
 from __future__ import annotations
 
-import json
+import asyncio
+import functools
+import hashlib
+import os
 import random
 import re
+import tempfile
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from typing import IO, Any, Callable, Deque, Dict, FrozenSet, List, Optional, Sequence, Tuple, Union
 
+import orjson
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.messages import TextMessage
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient
 
 from cli_clients import (
+    CliProcessError,
     CodexCliChatCompletionClient,
     GeminiCliChatCompletionClient,
     MockCliChatCompletionClient,
@@ -19,8 +28,34 @@ from cli_clients import (
 
 ActionDict = Dict[str, str]
 
+_DIRECTIONS: Tuple[Tuple[str, int, int], ...] = (
+    ("up", 0, -1),
+    ("down", 0, 1),
+    ("left", -1, 0),
+    ("right", 1, 0),
+)
+_MOVE_DELTA: Dict[str, Tuple[int, int]] = {name: (dx, dy) for name, dx, dy in _DIRECTIONS}
+_PROMPT_PREFIX = (
+    "You will receive the current situation and the available legal actions as JSON. "
+    "Choose exactly one entry from legal_actions and respond only with the specified JSON shape.\n"
+)
+_COORDINATOR_PROMPT_PREFIX = (
+    "You will receive, for each agent id, that agent's current situation and available legal actions as JSON. "
+    "Choose exactly one entry from each agent's legal_actions and respond only with the specified JSON shape.\n"
+)
+_WAITED_NOTE = "Waited."
+# The debug log is compacted to the turns still in history once it grows past this size
+# (or past twice its size after the previous compaction, whichever is larger).
+_DEBUG_LOG_COMPACT_BYTES = 4 * 1024 * 1024
+# Upper bound on concurrent CLI calls summed over all sessions, on top of each simulation's own cap.
+_GLOBAL_QUERY_LIMIT = max(int(os.environ.get("SANDBOX_MAX_CLI_QUERIES", "8")), 1)
+_global_query_slots: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+# Failures worth another attempt; a missing executable or an unparsable reply will not improve on retry.
+_TRANSIENT_QUERY_ERRORS: Tuple[type, ...] = (CliProcessError, asyncio.TimeoutError, TimeoutError, ConnectionError)
+_JSON_STRUCTURE_RE = re.compile(r'[\[\]{}"\\]')
 
-@dataclass
+
+@dataclass(slots=True)
 class AgentState:
     name: str
     controller: Optional[AssistantAgent]
@@ -28,96 +63,229 @@ class AgentState:
     y: int
     inbox: Optional[Dict[str, str]] = None
     last_action: Optional[ActionDict] = field(default=None, repr=False)
+    plan_queue: List[ActionDict] = field(default_factory=list, repr=False)
+    plan_key: Optional[Tuple[Tuple[str, int, int], ...]] = field(default=None, repr=False)
 
     @property
     def position(self) -> Dict[str, int]:
         return {"x": self.x, "y": self.y}
 
 
-def _build_system_prompt(persona: str, roster: str) -> str:
-    return (
-        f"{persona} Your teammates are {roster}. "
-        "Speak like a friendly adventurer, sharing your thoughts in the first person. "
-        "When you choose a talk action, pick one of the characters listed in legal_actions and greet them by name in a short English paragraph. "
+@dataclass
+class _PlannedAction:
+    """An LLM agent's pending decision within the current turn."""
+
+    agent: AgentState
+    legal_actions: List[ActionDict]
+    debug_entry: Dict[str, Any]
+    observation: Dict[str, object]
+    observation_json: str
+    move_dirs: FrozenSet[str] = frozenset()
+    talk_targets: FrozenSet[str] = frozenset()
+    prompt: Optional[str] = None
+    cache_key: Optional[Tuple[str, str]] = None
+    raw_response: Optional[Union[str, Exception]] = None
+    # the other agents' positions on the board the observation was built from
+    plan_key: Optional[Tuple[Tuple[str, int, int], ...]] = None
+    # index into the turn's coordinator calls when a coalesced query answered this entry
+    coordinator: Optional[int] = None
+
+
+_SYSTEM_PROMPT_TEMPLATE = (
+    "{persona} Your teammates are {roster}. "
+    "Speak like a friendly adventurer, sharing your thoughts in the first person. "
+    "When you choose a talk action, pick one of the characters listed in legal_actions and greet them by name in a short English paragraph. "
+    "Do not mention that you are an AI, write third-person commentary, or summarise for the user. "
+    "Avoid bullet points and tool usage; respond with empathy, questions, or suggestions that move the party forward. "
+    "You must select exactly one option from legal_actions and return JSON that matches it. "
+    'Return JSON only in the form {{"action": ..., "direction"|"target"|"message": ...}}. '
+    "For move, set direction. For talk, set target and message. For wait, omit the other fields."
+)
+_PLAN_AHEAD_TEMPLATE = (
+    " You may plan ahead by returning a JSON array of up to {plan_horizon} such objects, "
+    "one per upcoming turn; the first entry must come from the current legal_actions."
+)
+
+
+def _build_system_prompt(persona: str, roster: str, plan_horizon: int = 1) -> str:
+    prompt = _SYSTEM_PROMPT_TEMPLATE.format(persona=persona, roster=roster)
+    if plan_horizon > 1:
+        prompt += _PLAN_AHEAD_TEMPLATE.format(plan_horizon=plan_horizon)
+    return prompt
+
+
+def _build_coordinator_prompt(cast: str, plan_horizon: int = 1) -> str:
+    prompt = (
+        f"You voice every adventurer in this party. Each agent id is followed by its persona: {cast}. "
+        "Every character speaks like a friendly adventurer in the first person; when one chooses a talk action, "
+        "they greet the target by name in a short English paragraph. "
         "Do not mention that you are an AI, write third-person commentary, or summarise for the user. "
-        "Avoid bullet points and tool usage; respond with empathy, questions, or suggestions that move the party forward. "
-        "You must select exactly one option from legal_actions and return JSON that matches it. "
-        'Return JSON only in the form {"action": ..., "direction"|"target"|"message": ...}. '
+        "For every agent id you are given, select exactly one option from that agent's legal_actions. "
+        'Return JSON only, mapping each agent id to its action, e.g. {"agent1": {"action": "wait"}, '
+        '"agent2": {"action": "move", "direction": "up"}}. '
         "For move, set direction. For talk, set target and message. For wait, omit the other fields."
     )
+    if plan_horizon > 1:
+        prompt += (
+            f" You may plan ahead by mapping an agent id to a JSON array of up to {plan_horizon} such objects, "
+            "one per upcoming turn; the first entry must come from that agent's current legal_actions."
+        )
+    return prompt
 
 
-def _extract_json_block(raw: str) -> Optional[str]:
-    match = re.search(r"\{.*\}", raw, re.DOTALL)
-    if not match:
+def _extract_json_block(raw: str, opener: str = "{", closer: str = "}") -> Optional[str]:
+    """Return the first balanced ``opener...closer`` block in ``raw``, ignoring brackets inside strings."""
+    start = raw.find(opener)
+    if start < 0:
         return None
-    return match.group(0)
+    depth = 0
+    in_string = False
+    skip_to = start
+    # Only brackets, quotes and backslashes affect nesting, so jump straight between them.
+    for match in _JSON_STRUCTURE_RE.finditer(raw, start):
+        index = match.start()
+        if index < skip_to:
+            continue
+        char = match.group()
+        if char == "\\":
+            skip_to = index + 2
+        elif char == '"':
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif char == opener:
+            depth += 1
+        elif char == closer:
+            depth -= 1
+            if depth == 0:
+                return raw[start : index + 1]
+    return None
 
 
 def _parse_action(raw: str) -> ActionDict:
+    stripped = raw.strip()
+    if stripped[:1] == "{" and stripped[-1:] == "}":
+        # Well-behaved replies are a bare JSON object; decode them without scanning.
+        try:
+            return _normalise_action(orjson.loads(stripped))
+        except orjson.JSONDecodeError:
+            pass
     block = _extract_json_block(raw)
     if not block:
         return {"action": "wait"}
     try:
-        data = json.loads(block)
-    except json.JSONDecodeError:
+        data = orjson.loads(block)
+    except orjson.JSONDecodeError:
         return {"action": "wait"}
-    action = data.get("action")
-    if action not in {"move", "talk", "wait"}:
+    return _normalise_action(data)
+
+
+def _parse_plan(raw: str, limit: int) -> List[ActionDict]:
+    """Parse up to ``limit`` queued actions, accepting a JSON array or a single object."""
+    array_start = raw.find("[")
+    object_start = raw.find("{")
+    if array_start >= 0 and (object_start < 0 or array_start < object_start):
+        block = _extract_json_block(raw, "[", "]")
+        if block:
+            try:
+                data = orjson.loads(block)
+            except orjson.JSONDecodeError:
+                data = None
+            if isinstance(data, list) and data:
+                return [_normalise_action(entry) for entry in data[:limit]]
+    return [_parse_action(raw)]
+
+
+def _parse_move(data: Dict[str, Any]) -> ActionDict:
+    direction = data.get("direction")
+    if not isinstance(direction, str) or direction not in _MOVE_DELTA:
         return {"action": "wait"}
-    if action == "move":
-        direction = data.get("direction")
-        if direction not in {"up", "down", "left", "right"}:
-            return {"action": "wait"}
-        return {"action": "move", "direction": direction}
-    if action == "talk":
-        target = data.get("target")
-        message = data.get("message")
-        if not isinstance(target, str) or not isinstance(message, str):
-            return {"action": "wait"}
-        return {"action": "talk", "target": target, "message": message}
+    return {"action": "move", "direction": direction}
+
+
+def _parse_talk(data: Dict[str, Any]) -> ActionDict:
+    target = data.get("target")
+    message = data.get("message")
+    if not isinstance(target, str) or not isinstance(message, str):
+        return {"action": "wait"}
+    return {"action": "talk", "target": target, "message": message}
+
+
+def _parse_wait(data: Dict[str, Any]) -> ActionDict:
     return {"action": "wait"}
 
 
-def _move_delta(direction: str) -> Tuple[int, int]:
-    return {
-        "up": (0, -1),
-        "down": (0, 1),
-        "left": (-1, 0),
-        "right": (1, 0),
-    }[direction]
+_ACTION_HANDLERS: Dict[str, Callable[[Dict[str, Any]], ActionDict]] = {
+    "move": _parse_move,
+    "talk": _parse_talk,
+    "wait": _parse_wait,
+}
+
+
+def _normalise_action(data: Any) -> ActionDict:
+    if not isinstance(data, dict):
+        return {"action": "wait"}
+    action = data.get("action")
+    handler = _ACTION_HANDLERS.get(action, _parse_wait) if isinstance(action, str) else _parse_wait
+    return handler(data)
 
 
 def _is_adjacent(a: AgentState, b: AgentState) -> bool:
     return abs(a.x - b.x) + abs(a.y - b.y) == 1
 
 
-def _legal_actions(agent: AgentState, agents: Sequence[AgentState], grid_size: int) -> List[ActionDict]:
+def _occupancy(agents: Sequence[AgentState]) -> Dict[Tuple[int, int], str]:
+    """Map each occupied cell to the name of the agent standing on it."""
+    return {(agent.x, agent.y): agent.name for agent in agents}
+
+
+def _legal_actions(
+    agent: AgentState,
+    agents: Sequence[AgentState],
+    grid_size: int,
+    occupied: Optional[Dict[Tuple[int, int], str]] = None,
+    titles: Optional[Dict[str, str]] = None,
+) -> List[ActionDict]:
+    """List ``agent``'s legal actions; talk entries carry ``target_title`` when ``titles`` is given."""
+    if occupied is None:
+        occupied = _occupancy(agents)
     legal: List[ActionDict] = [{"action": "wait"}]
-    for direction, (dx, dy) in {
-        "up": (0, -1),
-        "down": (0, 1),
-        "left": (-1, 0),
-        "right": (1, 0),
-    }.items():
+    for direction, dx, dy in _DIRECTIONS:
         new_x = agent.x + dx
         new_y = agent.y + dy
-        if (
-            0 <= new_x < grid_size
-            and 0 <= new_y < grid_size
-            and not any(
-                other.name != agent.name and other.x == new_x and other.y == new_y
-                for other in agents
-            )
-        ):
+        if 0 <= new_x < grid_size and 0 <= new_y < grid_size and (new_x, new_y) not in occupied:
             legal.append({"action": "move", "direction": direction})
 
-    for other in agents:
-        if other.name != agent.name and _is_adjacent(agent, other):
-            legal.append({"action": "talk", "target": other.name})
+    for _, dx, dy in _DIRECTIONS:
+        neighbour = occupied.get((agent.x + dx, agent.y + dy))
+        if neighbour is None:
+            continue
+        if titles is None:
+            legal.append({"action": "talk", "target": neighbour})
+        else:
+            legal.append({"action": "talk", "target": neighbour, "target_title": titles.get(neighbour, neighbour)})
     return legal
 
 
+def _retry_delay(attempt: int) -> float:
+    """Exponential backoff with a little jitter for transient CLI failures."""
+    return 2**attempt * 0.5 + random.random() * 0.1
+
+
+def _global_query_semaphore() -> asyncio.Semaphore:
+    """Return the semaphore capping CLI calls across every simulation on the running loop."""
+    global _global_query_slots
+    loop = asyncio.get_running_loop()
+    if _global_query_slots is None or _global_query_slots[0] is not loop:
+        _global_query_slots = (loop, asyncio.Semaphore(_GLOBAL_QUERY_LIMIT))
+    return _global_query_slots[1]
+
+
+@functools.lru_cache(maxsize=256)
+def _serialize_legal_actions(actions: Tuple[Tuple[Tuple[str, str], ...], ...]) -> str:
+    return orjson.dumps([dict(entry) for entry in actions]).decode("utf-8")
+
+
 class SandboxSimulation:
     """Manages LLM-backed agents inside a grid sandbox."""
 
@@ -130,9 +298,22 @@ class SandboxSimulation:
         seed: Optional[int] = None,
         backend: str = "gemini",
         player_agent: bool = False,
+        plan_horizon: int = 1,
+        cache_responses: bool = False,
+        response_cache_size: int = 1024,
+        max_concurrent_queries: Optional[int] = None,
+        query_attempts: int = 3,
+        coalesce_agents: bool = False,
+        history_limit: int = 200,
     ) -> None:
         if num_agents < 2:
             raise ValueError("This prototype currently supports at least 2 agents.")
+        if plan_horizon < 1:
+            raise ValueError("plan_horizon must be at least 1.")
+        if max_concurrent_queries is None:
+            max_concurrent_queries = num_agents
+        if max_concurrent_queries < 1 or query_attempts < 1:
+            raise ValueError("max_concurrent_queries and query_attempts must be at least 1.")
         self.num_agents = num_agents
         self.grid_size = grid_size
         self.debug = debug
@@ -140,16 +321,44 @@ class SandboxSimulation:
         self._rng = random.Random(seed)
         self.backend = backend.lower()
         self.player_enabled = player_agent
+        self.plan_horizon = plan_horizon
+        self._model_client: Optional[ChatCompletionClient] = None
+        self.cache_responses = cache_responses
+        self._response_cache_size = response_cache_size
+        self._response_cache: OrderedDict[Tuple[str, str], str] = OrderedDict()
+        self._query_semaphore = asyncio.Semaphore(max_concurrent_queries)
+        self._query_attempts = query_attempts
+        self.coalesce_agents = coalesce_agents
+        self._coordinator: Optional[AssistantAgent] = None
+        self._controllers: Dict[str, Optional[AssistantAgent]] = {}
+        self._contexts_stale = False
         self.player_agent_name: Optional[str] = None
         self.pending_player: Optional[dict[str, Any]] = None
         self._active_turn_messages: Optional[List[Dict[str, str]]] = None
         self._active_turn_debug: Optional[List[Dict[str, Any]]] = None
+        self._active_turn_coordinator: Optional[List[Dict[str, Any]]] = None
 
         self.turn = 0
         self.agents: List[AgentState] = []
+        self._agent_by_name: Dict[str, AgentState] = {}
         self.conversation_log: List[Dict[str, str]] = []
-        self.debug_history: List[Dict[str, object]] = []
+        self._log_view: Optional[Tuple[Dict[str, str], ...]] = None
+        # orjson-encoded snapshot(), dropped whenever the turn, a position or the log changes
+        self._snapshot_bytes: Optional[bytes] = None
+        self.debug_history: Deque[Dict[str, object]] = deque(maxlen=history_limit)
+        self._debug_log: Optional[IO[bytes]] = None
+        self._debug_log_compacted_size = 0
+        self._history_view: Optional[Tuple[Dict[str, object], ...]] = None
+        self._history_limit = history_limit
+        # turn -> (conversation log length, agent positions) at the end of that turn
+        self._turn_marks: OrderedDict[int, Tuple[int, Dict[str, Tuple[int, int]]]] = OrderedDict()
         self.agent_profiles: Dict[str, Dict[str, str]] = {}
+        # LLM-facing view of agent_profiles: titles only. Each persona is already in its own
+        # controller's system prompt (and the coordinator's), and icon/colour/glow are frontend-only.
+        self._prompt_traits: Dict[str, Dict[str, str]] = {}
+        self._title_by_name: Dict[str, str] = {}
+        self._traits_json = "{}"
+        self._positions_json: Optional[Tuple[Dict[str, Dict[str, int]], str]] = None
         self._personas_pool: List[Dict[str, str]] = [
             {
                 "title": "Alex",
@@ -188,18 +397,36 @@ class SandboxSimulation:
             },
         ]
 
-    def reset(self) -> Dict[str, object]:
-        """Initialise positions and re-create agents."""
+    def reset(self, *, reseed: bool = False) -> Dict[str, object]:
+        """Initialise positions and agents, reusing controllers built by an earlier reset."""
+        if reseed:
+            self._rng = random.Random(self.seed)
         self.turn = 0
         self.conversation_log = []
-        self.debug_history = []
-        self.agent_profiles = {}
+        self._log_view = None
+        self._snapshot_bytes = None
+        self.debug_history.clear()
+        self._history_view = None
+        if self.debug:
+            if self._debug_log is None:
+                self._debug_log = tempfile.TemporaryFile(prefix="sandbox-debug-", suffix=".jsonl")
+            self._debug_log.truncate(0)
+            self._debug_log_compacted_size = 0
         self.pending_player = None
         self._active_turn_messages = None
         self._active_turn_debug = None
+        self._active_turn_coordinator = None
 
         positions = self._initial_positions()
-        controllers = self._build_controllers()
+        if self._controllers:
+            self._contexts_stale = True
+        else:
+            self.agent_profiles = {}
+            self._controllers = self._build_controllers()
+            self._prompt_traits = {name: {"title": profile["title"]} for name, profile in self.agent_profiles.items()}
+            self._traits_json = orjson.dumps(self._prompt_traits).decode("utf-8")
+            self._title_by_name = {name: profile["title"] for name, profile in self.agent_profiles.items()}
+        controllers = self._controllers
         self.agents = [
             AgentState(
                 name=name,
@@ -209,13 +436,18 @@ class SandboxSimulation:
             )
             for name in sorted(controllers.keys())
         ]
+        self._agent_by_name = {agent.name: agent for agent in self.agents}
+        self._turn_marks.clear()
+        self._mark_turn()
         return self.snapshot()
 
     def _initial_positions(self) -> Dict[str, Dict[str, int]]:
-        cells = [(x, y) for x in range(self.grid_size) for y in range(self.grid_size)]
-        self._rng.shuffle(cells)
-        agent_names = [f"agent{i+1}" for i in range(self.num_agents)]
-        return {name: {"x": pos[0], "y": pos[1]} for name, pos in zip(agent_names, cells)}
+        # Sample distinct cell indices instead of materialising and shuffling the whole grid.
+        cells = self._rng.sample(range(self.grid_size * self.grid_size), self.num_agents)
+        return {
+            f"agent{i+1}": {"x": cell // self.grid_size, "y": cell % self.grid_size}
+            for i, cell in enumerate(cells)
+        }
 
     def _build_controllers(self) -> Dict[str, Optional[AssistantAgent]]:
         controllers: Dict[str, Optional[AssistantAgent]] = {}
@@ -241,25 +473,55 @@ class SandboxSimulation:
             }
             self.agent_profiles[self.player_agent_name] = profile
 
-        for name in agent_names:
+        titles = [f"{self.agent_profiles[name]['title']} ({name})" for name in agent_names]
+        for index, name in enumerate(agent_names):
             if name == self.player_agent_name:
                 controllers[name] = None
                 continue
-            roster = [
-                f"{self.agent_profiles[other]['title']} ({other})"
-                for other in agent_names
-                if other != name
-            ]
-            roster_desc = ", ".join(roster)
+            roster_desc = ", ".join(titles[:index] + titles[index + 1 :])
             persona = self.agent_profiles[name]["persona"]
             controllers[name] = AssistantAgent(
                 name=name,
-                system_message=_build_system_prompt(persona, roster_desc),
-                model_client=self._build_model_client(),
+                system_message=_build_system_prompt(persona, roster_desc, self.plan_horizon),
+                model_client=self._shared_model_client(),
+            )
+
+        self._coordinator = None
+        if self.coalesce_agents:
+            cast = "; ".join(
+                f"{name} ({self.agent_profiles[name]['title']}): {self.agent_profiles[name]['persona']}"
+                for name in agent_names
+                if controllers[name] is not None
+            )
+            self._coordinator = AssistantAgent(
+                name="coordinator",
+                system_message=_build_coordinator_prompt(cast, self.plan_horizon),
+                model_client=self._shared_model_client(),
             )
         return controllers
 
-    def _build_model_client(self):
+    def _shared_model_client(self) -> ChatCompletionClient:
+        """Return the model client shared by every controller of this simulation."""
+        if self._model_client is None:
+            self._model_client = self._build_model_client()
+        return self._model_client
+
+    def clear_cache(self) -> None:
+        """Forget cached LLM responses so repeated board states are queried afresh."""
+        self._response_cache.clear()
+
+    async def close(self) -> None:
+        """Release the shared model client and debug log; the next reset() rebuilds the controllers."""
+        if self._debug_log is not None:
+            self._debug_log.close()
+            self._debug_log = None
+        self._controllers = {}
+        self._coordinator = None
+        if self._model_client is not None:
+            await self._model_client.close()
+            self._model_client = None
+
+    def _build_model_client(self) -> ChatCompletionClient:
         if self.backend == "codex":
             return CodexCliChatCompletionClient(debug=self.debug)
         if self.backend == "gemini":
@@ -277,22 +539,70 @@ class SandboxSimulation:
                 for agent in self.agents
             ],
             "traits": self.agent_profiles,
-            "messages": list(self.conversation_log),
+            "messages": self._conversation_view(),
             "backend": self.backend,
             "playerAgent": bool(self.player_agent_name),
         }
 
+    def snapshot_bytes(self) -> bytes:
+        """Return ``snapshot()`` encoded as JSON, reusing the encoding until the board changes."""
+        if self._snapshot_bytes is None:
+            self._snapshot_bytes = orjson.dumps(self.snapshot())
+        return self._snapshot_bytes
+
+    def snapshot_delta(self, since_turn: int) -> Dict[str, object]:
+        """Return what changed after ``since_turn``: moved agents and newly logged messages.
+
+        Falls back to a full snapshot (``"full": True``) when ``since_turn`` is unknown or has
+        been pruned; static fields such as traits and grid size only travel in full snapshots.
+        """
+        mark = self._turn_marks.get(since_turn)
+        if mark is None:
+            return {"turn": self.turn, "full": True, "snapshot": self.snapshot()}
+        log_length, positions = mark
+        return {
+            "turn": self.turn,
+            "full": False,
+            "agentsMoved": [
+                {"name": agent.name, "position": agent.position}
+                for agent in self.agents
+                if positions.get(agent.name) != (agent.x, agent.y)
+            ],
+            "newMessages": self.conversation_log[log_length:],
+        }
+
+    def _mark_turn(self) -> None:
+        self._turn_marks[self.turn] = (
+            len(self.conversation_log),
+            {agent.name: (agent.x, agent.y) for agent in self.agents},
+        )
+        while len(self._turn_marks) > self._history_limit + 1:
+            self._turn_marks.popitem(last=False)
+
     async def step(self) -> Dict[str, object]:
         if not self.agents:
             raise RuntimeError("Simulation not initialised. Call reset() first.")
         if self.pending_player:
             raise RuntimeError("Awaiting player action; resolve before advancing the turn.")
 
+        if self._contexts_stale:
+            await self._clear_controller_contexts()
+
         self.turn += 1
+        self._snapshot_bytes = None
         self._active_turn_messages = []
         self._active_turn_debug = []
+        self._active_turn_coordinator = []
         return await self._continue_turn_from(0)
 
+    async def _clear_controller_contexts(self) -> None:
+        """Forget the previous game's conversation held by reused controllers."""
+        controllers = [controller for controller in self._controllers.values() if controller is not None]
+        if self._coordinator is not None:
+            controllers.append(self._coordinator)
+        await asyncio.gather(*(controller.on_reset(CancellationToken()) for controller in controllers))
+        self._contexts_stale = False
+
     async def apply_player_action(self, action: Dict[str, Any]) -> Dict[str, object]:
         if self.pending_player is None:
             raise RuntimeError("No player action is pending.")
@@ -304,10 +614,10 @@ class SandboxSimulation:
         agent_index = info["agent_index"]
         agent = self.agents[agent_index]
 
-        validated = self._validate_player_action(action, info["legal_actions"], agent.name)
+        validated = self._validate_player_action(action, info["moves"], info["talks"], agent.name)
         agent.last_action = validated
         debug_entry = self._active_turn_debug[agent_index]
-        debug_entry["response"] = json.dumps(validated)
+        debug_entry["response"] = orjson.dumps(validated).decode("utf-8")
         debug_entry["action"] = validated
 
         self._apply_action(agent, validated, debug_entry)
@@ -317,42 +627,26 @@ class SandboxSimulation:
         assert self._active_turn_messages is not None
         assert self._active_turn_debug is not None
 
+        # LLM agents are observed against the same board and queried concurrently;
+        # their actions are then applied in roster order. A player-controlled agent
+        # flushes the pending batch first so it always sees the up-to-date board.
+        planned: List[_PlannedAction] = []
+        occupied = _occupancy(self.agents)
+        positions = self._batch_positions()
         for idx in range(start_index, len(self.agents)):
             agent = self.agents[idx]
-            legal_actions = _legal_actions(agent, self.agents, self.grid_size)
-            for entry in legal_actions:
-                if entry["action"] == "talk":
-                    profile = self.agent_profiles.get(entry["target"], {})
-                    entry["target_title"] = profile.get("title", entry["target"])
-
-            observation: Dict[str, object] = {
-                "you": agent.name,
-                "positions": {state.name: state.position for state in self.agents},
-                "grid_size": self.grid_size,
-                "turn": self.turn,
-                "legal_actions": legal_actions,
-                "traits": self.agent_profiles,
-            }
-            if agent.inbox:
-                observation["message"] = agent.inbox
-            agent.inbox = None
-
-            debug_entry: Dict[str, Any] = {
-                "agent": agent.name,
-                "prompt": json.dumps(observation, ensure_ascii=False),
-                "legal_actions": legal_actions,
-                "response": None,
-                "action": None,
-            }
-            self._active_turn_debug.append(debug_entry)
-
             if agent.controller is None:
+                await self._resolve_planned(planned, occupied)
+                planned = []
+                legal_actions, _, _, _ = self._plan_agent(agent, occupied, self._batch_positions())
                 legal_copy = [dict(entry) for entry in legal_actions]
                 self.pending_player = {
                     "agent_index": idx,
                     "legal_actions": legal_copy,
+                    "moves": {entry["direction"]: entry for entry in legal_copy if entry["action"] == "move"},
+                    "talks": {entry["target"]: entry for entry in legal_copy if entry["action"] == "talk"},
                 }
-                return {
+                partial: Dict[str, object] = {
                     "turn": self.turn,
                     "snapshot": self.snapshot(),
                     "turnMessages": list(self._active_turn_messages),
@@ -364,32 +658,232 @@ class SandboxSimulation:
                         "traits": self.agent_profiles.get(agent.name, {}),
                     },
                 }
+                if self._active_turn_coordinator:
+                    partial["coordinator"] = list(self._active_turn_coordinator)
+                return partial
 
-            prompt = self._build_prompt(observation)
-            raw_response = await self._query_action(agent.controller, prompt, agent.name)
-            action = _parse_action(raw_response)
-            action = self._enforce_legality(action, legal_actions, agent.name)
-            agent.last_action = action
+            use_queue = self._plan_queue_valid(agent)
+            legal_actions, observation, observation_json, debug_entry = self._plan_agent(
+                agent, occupied, positions
+            )
+            entry = _PlannedAction(
+                agent,
+                legal_actions,
+                debug_entry,
+                observation,
+                observation_json,
+                move_dirs=frozenset(e["direction"] for e in legal_actions if e["action"] == "move"),
+                talk_targets=frozenset(e["target"] for e in legal_actions if e["action"] == "talk"),
+            )
+            if not use_queue:
+                entry.prompt = self._build_prompt(observation_json)
+                entry.plan_key = self._plan_key(agent)
+                if self.cache_responses:
+                    entry.cache_key = self._response_cache_key(agent, observation_json)
+                    entry.raw_response = self._response_cache.get(entry.cache_key)
+                    if entry.raw_response is not None:
+                        self._response_cache.move_to_end(entry.cache_key)
+            planned.append(entry)
 
-            debug_entry["prompt"] = prompt
-            debug_entry["response"] = raw_response
-            debug_entry["action"] = action
+        await self._resolve_planned(planned, occupied)
+        return self._finalise_turn()
+
+    def _plan_agent(
+        self,
+        agent: AgentState,
+        occupied: Optional[Dict[Tuple[int, int], str]] = None,
+        positions: Optional[Dict[str, Dict[str, int]]] = None,
+    ) -> Tuple[List[ActionDict], Dict[str, object], str, Dict[str, Any]]:
+        """Build legal actions, the observation (and its JSON) and the debug entry for ``agent``.
 
-            self._apply_action(agent, action, debug_entry)
+        ``positions`` may be shared by every observation planned against the same board.
+        """
+        assert self._active_turn_debug is not None
+        if positions is None:
+            positions = self._batch_positions()
 
-        return self._finalise_turn()
+        legal_actions = _legal_actions(agent, self.agents, self.grid_size, occupied, self._title_by_name)
 
-    def _build_prompt(self, observation: Dict[str, object]) -> str:
-        return (
-            "You will receive the current situation and the available legal actions as JSON. "
-            "Choose exactly one entry from legal_actions and respond only with the specified JSON shape.\n"
-            f"{json.dumps(observation, ensure_ascii=False)}"
+        observation: Dict[str, object] = {
+            "you": agent.name,
+            "positions": positions,
+            "grid_size": self.grid_size,
+            "turn": self.turn,
+            "legal_actions": legal_actions,
+            "traits": self._prompt_traits,
+        }
+        if agent.inbox:
+            observation["message"] = agent.inbox
+        agent.inbox = None
+
+        observation_json = self._encode_observation(observation)
+        debug_entry: Dict[str, Any] = {
+            "agent": agent.name,
+            "prompt": observation_json,
+            "legal_actions": legal_actions,
+            "response": None,
+            "action": None,
+        }
+        self._active_turn_debug.append(debug_entry)
+        return legal_actions, observation, observation_json, debug_entry
+
+    def _batch_positions(self) -> Dict[str, Dict[str, int]]:
+        """Build the positions map for one planning batch and cache its JSON encoding."""
+        positions = {state.name: {"x": state.x, "y": state.y} for state in self.agents}
+        self._positions_json = (positions, orjson.dumps(positions).decode("utf-8"))
+        return positions
+
+    def _plan_queue_valid(self, agent: AgentState) -> bool:
+        """Return whether ``agent`` can consume its queued plan instead of calling the LLM."""
+        if not agent.plan_queue:
+            return False
+        if agent.inbox is not None or agent.plan_key != self._plan_key(agent):
+            agent.plan_queue.clear()
+            return False
+        return True
+
+    def _plan_key(self, agent: AgentState) -> Tuple[Tuple[str, int, int], ...]:
+        return tuple((other.name, other.x, other.y) for other in self.agents if other is not agent)
+
+    def _response_cache_key(self, agent: AgentState, observation_json: str) -> Tuple[str, str]:
+        """Key responses by persona and board state; the turn counter is left out so states can recur."""
+        # Quotes inside string values are escaped, so the first match is the top-level field.
+        stable = observation_json.replace(f',"turn":{self.turn}', "", 1)
+        digest = hashlib.blake2b(stable.encode("utf-8"), digest_size=16).hexdigest()
+        return self.agent_profiles[agent.name]["persona"], digest
+
+    def _remember_response(self, key: Tuple[str, str], raw_response: str) -> None:
+        self._response_cache[key] = raw_response
+        self._response_cache.move_to_end(key)
+        while len(self._response_cache) > self._response_cache_size:
+            self._response_cache.popitem(last=False)
+
+    async def _resolve_planned(
+        self, planned: Sequence[_PlannedAction], occupied: Dict[Tuple[int, int], str]
+    ) -> None:
+        if not planned:
+            return
+        queries = [entry for entry in planned if entry.prompt is not None and entry.raw_response is None]
+        if self._coordinator is not None and len(queries) > 1:
+            await self._query_coordinator(self._coordinator, queries)
+            for entry in queries:
+                if entry.cache_key is not None and entry.raw_response is not None:
+                    self._remember_response(entry.cache_key, entry.raw_response)
+            queries = [entry for entry in queries if entry.raw_response is None]
+        responses = await asyncio.gather(
+            *(self._query_action(entry.agent.controller, entry.prompt, entry.agent.name) for entry in queries),
+            return_exceptions=True,
         )
+        for entry, response in zip(queries, responses):
+            if isinstance(response, BaseException) and not isinstance(response, Exception):
+                raise response
+            entry.raw_response = response
+            if entry.cache_key is not None and isinstance(response, str):
+                self._remember_response(entry.cache_key, response)
 
-    async def _query_action(self, controller: AssistantAgent, prompt: str, agent_name: str) -> str:
-        result = await controller.run(
-            task=[TextMessage(content=prompt, source="user")]
+        for entry in planned:
+            agent = entry.agent
+            debug_entry = entry.debug_entry
+            if entry.prompt is None:
+                queued = agent.plan_queue.pop(0)
+                debug_entry["response"] = f"[queued plan] {orjson.dumps(queued).decode('utf-8')}"
+                action = self._enforce_legality(queued, entry.move_dirs, entry.talk_targets, agent.name)
+                if action is not queued:
+                    agent.plan_queue.clear()
+            else:
+                raw_response = entry.raw_response
+                if isinstance(raw_response, Exception):
+                    action = {
+                        "action": "wait",
+                        "notes": f"LLM call failed for {agent.name}: {raw_response}",
+                    }
+                    raw_response = f"[error] {raw_response}"
+                else:
+                    plan = _parse_plan(raw_response, self.plan_horizon)
+                    action = self._enforce_legality(plan[0], entry.move_dirs, entry.talk_targets, agent.name)
+                    agent.plan_queue = plan[1:] if action is plan[0] else []
+                    agent.plan_key = entry.plan_key
+                if entry.coordinator is None:
+                    debug_entry["prompt"] = entry.prompt
+                else:
+                    # The coalesced prompt is recorded once in the turn's coordinator calls;
+                    # the entry keeps its own observation and points at that call.
+                    debug_entry["coordinator"] = entry.coordinator
+                debug_entry["response"] = raw_response
+            agent.last_action = action
+            debug_entry["action"] = action
+
+            if not self._apply_action(agent, action, debug_entry, occupied):
+                # The board did not play out as planned, so the rest of the plan is stale.
+                agent.plan_queue.clear()
+
+    async def _query_coordinator(self, coordinator: AssistantAgent, queries: Sequence[_PlannedAction]) -> None:
+        """Ask for every queued agent's action in one call; unresolved entries keep ``raw_response`` unset."""
+        observations = ",".join(
+            f'"{entry.agent.name}":{entry.observation_json}' for entry in queries
         )
+        prompt = f"{_COORDINATOR_PROMPT_PREFIX}{{{observations}}}"
+        assert self._active_turn_coordinator is not None
+        call: Dict[str, Any] = {"prompt": prompt, "response": None}
+        index = len(self._active_turn_coordinator)
+        self._active_turn_coordinator.append(call)
+        try:
+            raw = await self._query_action(coordinator, prompt, coordinator.name)
+        except Exception as exc:
+            call["response"] = f"[error] {exc}"
+            return
+        call["response"] = raw
+        block = _extract_json_block(raw)
+        if not block:
+            return
+        try:
+            data = orjson.loads(block)
+        except orjson.JSONDecodeError:
+            return
+        if not isinstance(data, dict):
+            return
+        for entry in queries:
+            choice = data.get(entry.agent.name)
+            if isinstance(choice, (dict, list)):
+                entry.coordinator = index
+                entry.raw_response = orjson.dumps(choice).decode("utf-8")
+
+    def _build_prompt(self, observation_json: str) -> str:
+        return _PROMPT_PREFIX + observation_json
+
+    def _encode_observation(self, observation: Dict[str, object]) -> str:
+        """Serialise ``observation`` as compact JSON, reusing cached fragments for stable fields."""
+        parts: List[str] = []
+        for key, value in observation.items():
+            if key == "traits" and value is self._prompt_traits:
+                encoded = self._traits_json
+            elif key == "positions" and self._positions_json is not None and value is self._positions_json[0]:
+                encoded = self._positions_json[1]
+            elif key == "legal_actions":
+                encoded = _serialize_legal_actions(
+                    tuple(tuple(entry.items()) for entry in value)  # type: ignore[union-attr]
+                )
+            else:
+                encoded = orjson.dumps(value).decode("utf-8")
+            parts.append(f'"{key}":{encoded}')
+        return "{" + ",".join(parts) + "}"
+
+    async def _query_action(self, controller: AssistantAgent, prompt: str, agent_name: str) -> str:
+        for attempt in range(self._query_attempts):
+            async with self._query_semaphore, _global_query_semaphore():
+                # run() records the task in the model context before calling the model, so a
+                # failed attempt is rolled back to keep retries from stacking duplicate prompts.
+                context_state = await controller.model_context.save_state()
+                try:
+                    result = await controller.run(
+                        task=[TextMessage(content=prompt, source="user")]
+                    )
+                    break
+                except Exception as exc:
+                    await controller.model_context.load_state(context_state)
+                    if attempt + 1 == self._query_attempts or not isinstance(exc, _TRANSIENT_QUERY_ERRORS):
+                        raise
+            await asyncio.sleep(_retry_delay(attempt))
         for message in reversed(result.messages):
             if hasattr(message, "to_text"):
                 text = message.to_text()
@@ -402,7 +896,8 @@ class SandboxSimulation:
     def _validate_player_action(
         self,
         action: Dict[str, Any],
-        legal_actions: List[ActionDict],
+        moves: Dict[str, ActionDict],
+        talks: Dict[str, ActionDict],
         agent_name: str,
     ) -> ActionDict:
         if not isinstance(action, dict):
@@ -410,27 +905,12 @@ class SandboxSimulation:
         choice = action.get("action")
         if choice == "move":
             direction = action.get("direction")
-            match = next(
-                (
-                    entry
-                    for entry in legal_actions
-                    if entry.get("action") == "move" and entry.get("direction") == direction
-                ),
-                None,
-            )
-            if not match:
+            if not isinstance(direction, str) or direction not in moves:
                 raise ValueError(f"Direction '{direction}' not allowed for {agent_name}.")
             return {"action": "move", "direction": direction}
         if choice == "talk":
             target = action.get("target")
-            match = next(
-                (
-                    entry
-                    for entry in legal_actions
-                    if entry.get("action") == "talk" and entry.get("target") == target
-                ),
-                None,
-            )
+            match = talks.get(target) if isinstance(target, str) else None
             if not match:
                 raise ValueError(f"Target '{target}' not available for talk.")
             message = action.get("message")
@@ -445,62 +925,139 @@ class SandboxSimulation:
     def _enforce_legality(
         self,
         action: ActionDict,
-        legal_actions: List[ActionDict],
+        move_dirs: FrozenSet[str],
+        talk_targets: FrozenSet[str],
         agent_name: str,
     ) -> ActionDict:
         if action["action"] == "move":
-            allowed = {
-                entry["direction"]
-                for entry in legal_actions
-                if entry.get("action") == "move"
-            }
-            if action.get("direction") not in allowed:
+            if action.get("direction") not in move_dirs:
                 return {"action": "wait", "notes": f"Illegal move rejected for {agent_name}"}
         elif action["action"] == "talk":
-            allowed = {
-                entry["target"]
-                for entry in legal_actions
-                if entry.get("action") == "talk"
-            }
-            if action.get("target") not in allowed:
+            if action.get("target") not in talk_targets:
                 return {"action": "wait", "notes": f"Illegal talk rejected for {agent_name}"}
         return action
 
-    def history(self) -> List[Dict[str, object]]:
-        return list(self.debug_history)
+    def history(self, since_turn: Optional[int] = None) -> Tuple[Dict[str, object], ...]:
+        """Return archived turns, optionally only those after ``since_turn``.
 
-    def _apply_action(self, agent: AgentState, action: ActionDict, debug_entry: Dict[str, Any]) -> None:
-        if self._active_turn_messages is None:
+        The tuple is built once per completed turn and shared between callers.
+        """
+        if self._history_view is None:
+            self._history_view = tuple(self.debug_history)
+        view = self._history_view
+        if since_turn is None or not view:
+            return view
+        first_turn = view[0]["turn"]
+        assert isinstance(first_turn, int)
+        return view[max(since_turn - first_turn + 1, 0) :]
+
+    def read_debug_log(self, offset: int) -> Dict[str, Any]:
+        """Return the prompt/response pair archived at ``offset`` by a debug-enabled run."""
+        if self._debug_log is None:
+            raise RuntimeError("Debug logging is disabled for this simulation.")
+        self._debug_log.seek(0, os.SEEK_END)
+        if not 0 <= offset < self._debug_log.tell():
+            raise ValueError(f"Debug log offset {offset} out of range.")
+        self._debug_log.seek(offset)
+        try:
+            record = orjson.loads(self._debug_log.readline())
+        except orjson.JSONDecodeError as exc:
+            raise ValueError(f"No debug record starts at offset {offset}.") from exc
+        if not isinstance(record, dict):
+            raise ValueError(f"No debug record starts at offset {offset}.")
+        return record
+
+    def _archive_debug_entry(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy ``entry`` for history, moving its prompt/response text to the debug log when one is open."""
+        if self._debug_log is None:
+            return dict(entry)
+        archived = {key: value for key, value in entry.items() if key not in ("prompt", "response")}
+        self._debug_log.seek(0, os.SEEK_END)
+        archived["log_offset"] = self._debug_log.tell()
+        self._debug_log.write(
+            orjson.dumps({"prompt": entry.get("prompt"), "response": entry.get("response")}) + b"\n"
+        )
+        return archived
+
+    def _compact_debug_log(self) -> None:
+        """Drop debug log records whose turns have left the bounded history, once the file is large."""
+        log = self._debug_log
+        assert log is not None
+        size = log.seek(0, os.SEEK_END)
+        if size <= max(_DEBUG_LOG_COMPACT_BYTES, 2 * self._debug_log_compacted_size):
             return
+        compacted = tempfile.TemporaryFile(prefix="sandbox-debug-", suffix=".jsonl")
+        retained: Deque[Dict[str, object]] = deque(maxlen=self.debug_history.maxlen)
+        for turn in self.debug_history:
+            # Copies, so history tuples already handed out keep their original offsets.
+            turn = dict(turn)
+            for key in ("debug", "coordinator"):
+                if key not in turn:
+                    continue
+                entries = []
+                for entry in turn[key]:  # type: ignore[union-attr]
+                    if "log_offset" in entry:
+                        log.seek(entry["log_offset"])
+                        record = log.readline()
+                        entry = {**entry, "log_offset": compacted.tell()}
+                        compacted.write(record)
+                    entries.append(entry)
+                turn[key] = entries
+            retained.append(turn)
+        log.close()
+        self._debug_log = compacted
+        self._debug_log_compacted_size = compacted.tell()
+        self.debug_history = retained
+        self._history_view = None
+
+    def _apply_action(
+        self,
+        agent: AgentState,
+        action: ActionDict,
+        debug_entry: Dict[str, Any],
+        occupied: Optional[Dict[Tuple[int, int], str]] = None,
+    ) -> bool:
+        """Apply ``action`` for ``agent``, keeping ``occupied`` in sync when a move succeeds.
+
+        Returns ``False`` when the action could not be carried out as chosen (a blocked move,
+        an unreachable talk target, or an unknown action that fell back to waiting).
+        """
+        if self._active_turn_messages is None:
+            return False
         kind = action.get("action")
-        if kind == "move":
+        if kind == "wait":
+            # Most common outcome (and every fallback), so it is checked first.
+            debug_entry["notes"] = _WAITED_NOTE
+        elif kind == "move":
             direction = action.get("direction")
-            if direction not in {"up", "down", "left", "right"}:
+            if direction not in _MOVE_DELTA:
                 debug_entry["notes"] = "Move direction missing; waited instead."
-                return
-            dx, dy = _move_delta(direction)
+                return False
+            dx, dy = _MOVE_DELTA[direction]
             new_x = agent.x + dx
             new_y = agent.y + dy
+            if occupied is None:
+                occupied = _occupancy(self.agents)
             blocked = (
                 new_x < 0
                 or new_x >= self.grid_size
                 or new_y < 0
                 or new_y >= self.grid_size
-                or any(
-                    other.name != agent.name and other.x == new_x and other.y == new_y
-                    for other in self.agents
-                )
+                or (new_x, new_y) in occupied
             )
             if blocked:
                 debug_entry["notes"] = "Move blocked; stayed in place."
-            else:
-                agent.x = new_x
-                agent.y = new_y
-                debug_entry["notes"] = f"Moved to ({agent.x}, {agent.y})."
+                return False
+            occupied.pop((agent.x, agent.y), None)
+            occupied[(new_x, new_y)] = agent.name
+            agent.x = new_x
+            agent.y = new_y
+            self._snapshot_bytes = None
+            debug_entry["notes"] = f"Moved to ({agent.x}, {agent.y})."
         elif kind == "talk":
             target_name = action.get("target")
             message = action.get("message")
-            target_agent = next((a for a in self.agents if a.name == target_name), None)
+            target_agent = self._agent_by_name.get(target_name) if isinstance(target_name, str) else None
             if target_agent and isinstance(message, str) and _is_adjacent(agent, target_agent):
                 payload = {
                     "from": agent.name,
@@ -511,23 +1068,47 @@ class SandboxSimulation:
                 target_agent.inbox = {"from": agent.name, "message": message}
                 self._active_turn_messages.append(payload)
                 self.conversation_log.append(payload)
+                self._log_view = None
+                self._snapshot_bytes = None
                 debug_entry["notes"] = f"Spoke to {target_name}."
             else:
                 debug_entry["notes"] = "Talk target invalid or not adjacent."
+                return False
         else:
-            debug_entry["notes"] = "Waited."
+            debug_entry["notes"] = _WAITED_NOTE
+            return False
+        return True
+
+    def _conversation_view(self) -> Tuple[Dict[str, str], ...]:
+        """Immutable copy of the conversation log, rebuilt only after a new message is logged."""
+        if self._log_view is None:
+            self._log_view = tuple(self.conversation_log)
+        return self._log_view
 
     def _finalise_turn(self) -> Dict[str, object]:
         snapshot = self.snapshot()
-        turn_messages = list(self._active_turn_messages or [])
-        turn_debug = list(self._active_turn_debug or [])
-        turn_result = {
+        # The per-turn lists are dropped below, so the result can take them over without copying.
+        turn_messages = self._active_turn_messages or []
+        turn_debug = self._active_turn_debug or []
+        turn_result: Dict[str, object] = {
             "turn": self.turn,
             "snapshot": snapshot,
             "turnMessages": turn_messages,
             "debug": turn_debug,
         }
-        self.debug_history.append(turn_result)
+        archived: Dict[str, object] = {
+            **turn_result,
+            "debug": [self._archive_debug_entry(entry) for entry in turn_debug],
+        }
+        if self._active_turn_coordinator:
+            turn_result["coordinator"] = self._active_turn_coordinator
+            archived["coordinator"] = [self._archive_debug_entry(call) for call in self._active_turn_coordinator]
+        self.debug_history.append(archived)
+        self._history_view = None
+        if self._debug_log is not None:
+            self._compact_debug_log()
+        self._mark_turn()
         self._active_turn_messages = None
         self._active_turn_debug = None
+        self._active_turn_coordinator = None
         return turn_result
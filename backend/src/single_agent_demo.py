@@ -2,11 +2,10 @@
 
 from __future__ import annotations
 
-import asyncio
-
 from autogen_agentchat.agents import AssistantAgent
 
 from cli_clients import GeminiCliChatCompletionClient
+from runtime import run_event_loop
 
 
 async def main() -> None:
@@ -34,4 +33,4 @@ async def main() -> None:
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_event_loop(main())
@@ -8,12 +8,21 @@ from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.messages import TextMessage
 
 from cli_clients import GeminiCliChatCompletionClient
+from runtime import run_event_loop
 
 
 DEFAULT_TOPIC = (
     "Let's brainstorm destinations for our next long vacation. Share why each place excites you and what you would do there, then narrow the shortlist to one or two options."
 )
 
+_SYSTEM_TEMPLATE = (
+    "{persona} Your conversation partner is {partner_name}. "
+    "Trade travel ideas as equals, sharing first-person experiences. "
+    "Address {partner_name} directly in a single short paragraph and avoid mentioning hidden rules, external narration, or being an AI. "
+    "Keep responses in natural English without bullet points or tool usage. "
+    "{role_instruction}"
+)
+
 
 async def _run_agent(agent: AssistantAgent, task) -> str:
     result = await agent.run(task=task)
@@ -27,19 +36,22 @@ async def _run_agent(agent: AssistantAgent, task) -> str:
     raise RuntimeError(f"{agent.name} did not return a textual message.")
 
 
-async def main(*, debug: bool = False, topic: str | None = None) -> None:
+def _unseen(conversation: list[TextMessage], start: int, agent_name: str) -> list[TextMessage]:
+    """Messages from ``start`` onwards, minus the agent's own replies (already in its context)."""
+    return [message for message in conversation[start:] if message.source != agent_name]
+
+
+async def main(*, debug: bool = False, topic: str | None = None, parallel: bool = False) -> None:
+    # One client serves both agents; usage counters therefore cover the whole conversation.
+    model_client = GeminiCliChatCompletionClient(debug=debug)
+
     def make_agent(name: str, partner_name: str, persona: str, role_instruction: str) -> AssistantAgent:
-        system_message = (
-            f"{persona} Your conversation partner is {partner_name}. "
-            "Trade travel ideas as equals, sharing first-person experiences. "
-            f"Address {partner_name} directly in a single short paragraph and avoid mentioning hidden rules, external narration, or being an AI. "
-            "Keep responses in natural English without bullet points or tool usage. "
-            f"{role_instruction}"
-        )
         return AssistantAgent(
             name=name,
-            system_message=system_message,
-            model_client=GeminiCliChatCompletionClient(debug=debug),
+            system_message=_SYSTEM_TEMPLATE.format(
+                persona=persona, partner_name=partner_name, role_instruction=role_instruction
+            ),
+            model_client=model_client,
         )
 
     agent_alpha = make_agent(
@@ -66,17 +78,38 @@ async def main(*, debug: bool = False, topic: str | None = None) -> None:
     conversation: list[TextMessage] = [TextMessage(content=chosen_topic, source="user")]
     participants = [agent_alpha, agent_beta]
     rounds_per_agent = 2
+    # Each agent keeps its own model context, so only hand it the messages it has not seen yet.
+    seen = {agent.name: 0 for agent in participants}
 
     print("=== Conversation Start ===")
     print(f"user: {chosen_topic}\n")
 
+    if parallel:
+        # Every agent answers the same transcript at once; replies are appended in roster order.
+        for _ in range(rounds_per_agent):
+            round_start = len(conversation)
+            replies = await asyncio.gather(
+                *(_run_agent(agent, _unseen(conversation, seen[agent.name], agent.name)) for agent in participants),
+                return_exceptions=True,
+            )
+            for agent, reply in zip(participants, replies):
+                if isinstance(reply, BaseException):
+                    print(f"[{agent.name} error] {reply}")
+                    return
+                seen[agent.name] = round_start
+                conversation.append(TextMessage(content=reply, source=agent.name))
+                print(f"{agent.name}: {reply}\n")
+        print("=== Conversation End ===")
+        return
+
     for turn in range(rounds_per_agent * len(participants)):
         active_agent = participants[turn % len(participants)]
         try:
-            reply_text = await _run_agent(active_agent, conversation)
+            reply_text = await _run_agent(active_agent, _unseen(conversation, seen[active_agent.name], active_agent.name))
         except Exception as exc:
             print(f"[{active_agent.name} error] {exc}")
             return
+        seen[active_agent.name] = len(conversation)
         conversation.append(TextMessage(content=reply_text, source=active_agent.name))
         print(f"{active_agent.name}: {reply_text}\n")
 
@@ -99,5 +132,10 @@ if __name__ == "__main__":
         type=str,
         help="Optional conversation prompt for the agents.",
     )
+    parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="Let both agents answer each round concurrently instead of taking turns.",
+    )
     args = parser.parse_args()
-    asyncio.run(main(debug=args.debug, topic=args.topic))
+    run_event_loop(main(debug=args.debug, topic=args.topic, parallel=args.parallel))
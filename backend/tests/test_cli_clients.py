@@ -0,0 +1,61 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend" / "src"))
+
+import pytest
+from autogen_core.models import UserMessage
+
+from cli_clients import (
+    CLIChatCompletionClient,
+    CodexCliChatCompletionClient,
+    GeminiCliChatCompletionClient,
+    _extract_text_from_payload,
+    _walk_text,
+)
+
+
+def test_walk_text_keeps_document_order():
+    candidate = {
+        "text": "a",
+        "content": {"parts": [{"text": "d"}, "e"], "text": "c"},
+        "parts": ["b", {"parts": [{"text": "b2"}]}],
+    }
+    assert _walk_text(candidate) == ["a", "b", "b2", "c", "d", "e"]
+
+
+def test_extract_text_prefers_candidates_then_known_keys():
+    payload = {"candidates": [{"content": {"parts": [{"text": " hello "}, {"text": "world "}]}}]}
+    assert _extract_text_from_payload(payload, b"fallback") == "hello world"
+    assert _extract_text_from_payload({"response": " hi "}, b"fallback") == "hi"
+    assert _extract_text_from_payload({}, b" raw ") == "raw"
+
+
+def test_parsers_read_raw_cli_bytes():
+    codex_out = (
+        b'{"type": "thread.started"}\n'
+        b"not json\n"
+        b'{"item": {"type": "agent_message", "text": "{\\"action\\": \\"wait\\"}"}}\n'
+    )
+    assert CodexCliChatCompletionClient._parse_output(codex_out, b"") == '{"action": "wait"}'
+    assert CodexCliChatCompletionClient._parse_output(b"plain \xe2\x9c\x93\n", b"") == "plain \u2713"
+    gemini_out = '{"response": "caf\u00e9"}'.encode("utf-8")
+    assert GeminiCliChatCompletionClient._parse_output(gemini_out, b"noise") == "caf\u00e9"
+    assert GeminiCliChatCompletionClient._parse_response('{"response": "hi"}', "") == "hi"
+
+
+@pytest.mark.asyncio
+async def test_custom_parse_response_receives_text():
+    seen = []
+
+    def parse_response(stdout, stderr):
+        seen.append((stdout, stderr))
+        return stdout.strip()
+
+    client = CLIChatCompletionClient(
+        make_argv=lambda prompt: (sys.executable, "-c", "print('caf\\u00e9')"),
+        parse_response=parse_response,
+    )
+    result = await client.create([UserMessage(content="hi", source="user")])
+    assert result.content == "caf\u00e9"
+    assert seen == [("caf\u00e9\n", "")]
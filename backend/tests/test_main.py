@@ -0,0 +1,71 @@
+import sys
+from pathlib import Path
+
+import orjson
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend" / "src"))
+
+import main
+
+
+@pytest.mark.asyncio
+async def test_reset_evicts_least_recently_used_sessions(monkeypatch):
+    monkeypatch.setattr(main, "MAX_SESSIONS", 2)
+    monkeypatch.setattr(main, "simulations", main.OrderedDict())
+    monkeypatch.setattr(main, "session_configs", {})
+    monkeypatch.setattr(main, "session_last_used", {})
+    first, second = [
+        (await main.reset(main.ResetRequest(backend="mock", seed=seed)))["session_id"] for seed in (1, 2)
+    ]
+    oldest = main.simulations[first]
+    await main.step(first)  # touching the first session makes the second one the eviction candidate
+    dropped = main.simulations[second]
+    third = (await main.reset(main.ResetRequest(backend="mock", seed=3)))["session_id"]
+    assert list(main.simulations) == [first, third]
+    assert dropped._model_client is None and oldest._model_client is not None
+    for simulation in main.simulations.values():
+        await simulation.close()
+
+
+@pytest.mark.asyncio
+async def test_reset_evicts_idle_sessions(monkeypatch):
+    monkeypatch.setattr(main, "simulations", main.OrderedDict())
+    monkeypatch.setattr(main, "session_configs", {})
+    monkeypatch.setattr(main, "session_last_used", {})
+    stale = (await main.reset(main.ResetRequest(backend="mock")))["session_id"]
+    main.session_last_used[stale] -= main.SESSION_IDLE_SECONDS + 1
+    fresh = (await main.reset(main.ResetRequest(backend="mock")))["session_id"]
+    assert list(main.simulations) == [fresh]
+    await main.simulations[fresh].close()
+
+
+@pytest.mark.asyncio
+async def test_state_streams_values_read_before_the_response(monkeypatch):
+    monkeypatch.setattr(main, "simulations", main.OrderedDict())
+    monkeypatch.setattr(main, "session_configs", {})
+    monkeypatch.setattr(main, "session_last_used", {})
+    session_id = (await main.reset(main.ResetRequest(backend="mock", seed=5)))["session_id"]
+    await main.step(session_id)
+    response = await main.state(session_id)
+    simulation = main.simulations[session_id]
+    await main.step(session_id)  # a later turn must not leak into the already-built response
+    body = orjson.loads(b"".join([chunk async for chunk in response.body_iterator]))
+    assert body["snapshot"]["turn"] == 1
+    assert [entry["turn"] for entry in body["history"]] == [1]
+    await simulation.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_reconfigure_keeps_the_running_session(monkeypatch):
+    monkeypatch.setattr(main, "simulations", main.OrderedDict())
+    monkeypatch.setattr(main, "session_configs", {})
+    monkeypatch.setattr(main, "session_last_used", {})
+    session_id = (await main.reset(main.ResetRequest(backend="mock", seed=5)))["session_id"]
+    simulation = main.simulations[session_id]
+    with pytest.raises(main.HTTPException) as excinfo:
+        await main.reset(main.ResetRequest(session_id=session_id, backend="mock", num_agents=1))
+    assert excinfo.value.status_code == 400
+    assert main.simulations[session_id] is simulation
+    assert (await main.step(session_id)).status_code == 200
+    await simulation.close()
@@ -1,10 +1,13 @@
+import asyncio
 import sys
 from pathlib import Path
 
+import orjson
 import pytest
 
 sys.path.append(str(Path(__file__).resolve().parents[1] / "backend" / "src"))
 
+from cli_clients import CliProcessError
 from sandbox_simulation import SandboxSimulation
 
 
@@ -73,3 +76,321 @@ async def test_player_agent_requires_input_and_applies_action():
     assert not result.get("requiresPlayer", False)
     assert sim.pending_player is None
     assert sim.history()[-1]["turn"] == sim.turn
+
+
+@pytest.mark.asyncio
+async def test_agent_queries_run_concurrently_and_failures_wait(monkeypatch):
+    sim = SandboxSimulation(num_agents=3, grid_size=4, backend="mock", seed=5)
+    sim.reset()
+    in_flight = 0
+    peak = 0
+
+    async def fake_query(controller, prompt, agent_name):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        if agent_name == "agent2":
+            raise RuntimeError("CLI unavailable")
+        return '{"action": "wait"}'
+
+    monkeypatch.setattr(sim, "_query_action", fake_query)
+    result = await sim.step()
+    assert peak == 3
+    assert [entry["agent"] for entry in result["debug"]] == ["agent1", "agent2", "agent3"]
+    failed = result["debug"][1]
+    assert failed["action"]["action"] == "wait"
+    assert "CLI unavailable" in failed["response"]
+
+
+@pytest.mark.asyncio
+async def test_plan_horizon_reuses_queued_actions(monkeypatch):
+    sim = SandboxSimulation(num_agents=2, grid_size=3, backend="mock", seed=4, plan_horizon=3)
+    sim.reset()
+    calls = []
+
+    async def fake_query(controller, prompt, agent_name):
+        calls.append(agent_name)
+        return '[{"action": "wait"}, {"action": "wait"}, {"action": "wait"}]'
+
+    monkeypatch.setattr(sim, "_query_action", fake_query)
+    results = [await sim.step() for _ in range(4)]
+    # one call per agent covers three turns; the fourth turn re-plans
+    assert calls == ["agent1", "agent2", "agent1", "agent2"]
+    assert results[1]["debug"][0]["response"].startswith("[queued plan]")
+
+
+@pytest.mark.asyncio
+async def test_blocked_plan_is_dropped_instead_of_replayed(monkeypatch):
+    sim = SandboxSimulation(num_agents=2, grid_size=3, backend="mock", seed=1, plan_horizon=2)
+    sim.reset()
+    first, second = sim.agents
+    first.x, first.y = 1, 0
+    second.x, second.y = 2, 1
+    plans = {
+        "agent1": '[{"action": "move", "direction": "down"}, {"action": "wait"}]',
+        "agent2": '[{"action": "move", "direction": "left"}, {"action": "move", "direction": "up"}]',
+    }
+    calls = []
+
+    async def fake_query(controller, prompt, agent_name):
+        calls.append(agent_name)
+        return plans[agent_name]
+
+    monkeypatch.setattr(sim, "_query_action", fake_query)
+    result = await sim.step()
+    # agent1 takes (1, 1) first, so agent2's "left" is blocked
+    assert result["debug"][1]["notes"] == "Move blocked; stayed in place."
+    result = await sim.step()
+    assert calls == ["agent1", "agent2", "agent2"]
+    assert not result["debug"][1]["response"].startswith("[queued plan]")
+
+
+@pytest.mark.asyncio
+async def test_response_cache_skips_repeated_board_states(monkeypatch):
+    sim = SandboxSimulation(num_agents=2, grid_size=3, backend="mock", seed=4, cache_responses=True)
+    sim.reset()
+    calls = []
+
+    async def fake_query(controller, prompt, agent_name):
+        calls.append(agent_name)
+        return '{"action": "wait"}'
+
+    monkeypatch.setattr(sim, "_query_action", fake_query)
+    for _ in range(3):
+        result = await sim.step()
+    assert calls == ["agent1", "agent2"]
+    assert all(entry["action"] == {"action": "wait"} for entry in result["debug"])
+
+    sim.clear_cache()
+    await sim.step()
+    assert calls == ["agent1", "agent2", "agent1", "agent2"]
+
+
+@pytest.mark.asyncio
+async def test_query_action_retries_transient_failures(monkeypatch):
+    import sandbox_simulation
+
+    monkeypatch.setattr(sandbox_simulation, "_retry_delay", lambda attempt: 0)
+    sim = SandboxSimulation(num_agents=2, grid_size=3, backend="mock", seed=4, query_attempts=3)
+    sim.reset()
+    model_client = sim._model_client
+    original_create = model_client.create
+    failures = iter([CliProcessError("rate limited"), CliProcessError("rate limited")])
+
+    async def flaky_create(*args, **kwargs):
+        error = next(failures, None)
+        if error is not None:
+            raise error
+        return await original_create(*args, **kwargs)
+
+    monkeypatch.setattr(model_client, "create", flaky_create)
+    result = await sim.step()
+    assert not any(entry["response"].startswith("[error]") for entry in result["debug"])
+    for agent in sim.agents:
+        # failed attempts are rolled back, leaving one prompt and one reply per controller
+        context = await agent.controller.model_context.get_messages()
+        assert [type(message).__name__ for message in context] == ["UserMessage", "AssistantMessage"]
+
+
+@pytest.mark.asyncio
+async def test_query_action_does_not_retry_permanent_failures(monkeypatch):
+    import sandbox_simulation
+
+    monkeypatch.setattr(sandbox_simulation, "_retry_delay", lambda attempt: 0)
+    sim = SandboxSimulation(num_agents=2, grid_size=3, backend="mock", seed=4, query_attempts=3)
+    sim.reset()
+    calls = []
+
+    async def missing_cli(*args, **kwargs):
+        calls.append(1)
+        raise FileNotFoundError("gemini")
+
+    monkeypatch.setattr(sim._model_client, "create", missing_cli)
+    result = await sim.step()
+    assert len(calls) == 2
+    assert all(entry["response"].startswith("[error]") for entry in result["debug"])
+
+
+@pytest.mark.asyncio
+async def test_query_limit_is_shared_across_simulations(monkeypatch):
+    import sandbox_simulation
+
+    monkeypatch.setattr(sandbox_simulation, "_GLOBAL_QUERY_LIMIT", 1)
+    monkeypatch.setattr(sandbox_simulation, "_global_query_slots", None)
+    sims = [SandboxSimulation(num_agents=2, grid_size=3, backend="mock", seed=seed) for seed in (1, 2)]
+    active = 0
+    peak = 0
+    for sim in sims:
+        sim.reset()
+        original_create = sim._model_client.create
+
+        async def slow_create(*args, _create=original_create, **kwargs):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return await _create(*args, **kwargs)
+
+        monkeypatch.setattr(sim._model_client, "create", slow_create)
+    await asyncio.gather(*(sim.step() for sim in sims))
+    assert peak == 1
+
+
+@pytest.mark.asyncio
+async def test_coalesced_turn_uses_single_coordinator_call(monkeypatch):
+    sim = SandboxSimulation(num_agents=3, grid_size=4, backend="mock", seed=9, coalesce_agents=True)
+    sim.reset()
+    calls = []
+
+    async def fake_query(controller, prompt, agent_name):
+        calls.append(agent_name)
+        if agent_name == "coordinator":
+            return '{"agent1": {"action": "wait"}, "agent2": {"action": "wait"}}'
+        return '{"action": "wait"}'
+
+    monkeypatch.setattr(sim, "_query_action", fake_query)
+    result = await sim.step()
+    # agent3 was missing from the coordinator reply and falls back to its own call
+    assert calls == ["coordinator", "agent3"]
+    assert [entry["action"] for entry in result["debug"]] == [{"action": "wait"}] * 3
+    # the coalesced prompt is recorded once; answered entries point at it and keep their own observation
+    (call,) = result["coordinator"]
+    assert call["prompt"].count('"you":') == 3
+    assert [entry.get("coordinator") for entry in result["debug"]] == [0, 0, None]
+    assert all(call["prompt"] != entry["prompt"] for entry in result["debug"])
+    archived = sim.history()[-1]
+    assert archived["coordinator"] == [call]
+
+
+@pytest.mark.asyncio
+async def test_coalesced_responses_feed_the_response_cache(monkeypatch):
+    sim = SandboxSimulation(
+        num_agents=2, grid_size=3, backend="mock", seed=4, coalesce_agents=True, cache_responses=True
+    )
+    sim.reset()
+    calls = []
+
+    async def fake_query(controller, prompt, agent_name):
+        calls.append(agent_name)
+        return '{"agent1": {"action": "wait"}, "agent2": {"action": "wait"}}'
+
+    monkeypatch.setattr(sim, "_query_action", fake_query)
+    for _ in range(3):
+        await sim.step()
+    assert len(sim._response_cache) == 2
+    assert calls == ["coordinator"]
+
+
+@pytest.mark.asyncio
+async def test_reset_reuses_controllers_with_fresh_context():
+    sim = SandboxSimulation(num_agents=2, grid_size=3, backend="mock", seed=11)
+    sim.reset()
+    controllers = [agent.controller for agent in sim.agents]
+    await sim.step()
+    await sim.step()
+    first_context = await controllers[0].model_context.get_messages()
+
+    sim.reset(reseed=True)
+    assert [agent.controller for agent in sim.agents] == controllers
+    await sim.step()
+    fresh_context = await controllers[0].model_context.get_messages()
+    assert len(fresh_context) < len(first_context)
+
+
+@pytest.mark.asyncio
+async def test_history_is_bounded_and_archives_prompts_to_debug_log():
+    sim = SandboxSimulation(num_agents=2, grid_size=3, backend="mock", seed=6, debug=True, history_limit=3)
+    sim.reset()
+    results = [await sim.step() for _ in range(5)]
+    history = sim.history()
+    assert [entry["turn"] for entry in history] == [3, 4, 5]
+    archived = history[-1]["debug"][0]
+    assert "prompt" not in archived and "response" not in archived
+    record = sim.read_debug_log(archived["log_offset"])
+    assert record["prompt"] == results[-1]["debug"][0]["prompt"]
+    assert record["response"] == results[-1]["debug"][0]["response"]
+    await sim.close()
+
+
+@pytest.mark.asyncio
+async def test_debug_log_is_compacted_to_retained_history(monkeypatch):
+    import sandbox_simulation
+
+    monkeypatch.setattr(sandbox_simulation, "_DEBUG_LOG_COMPACT_BYTES", 1)
+    sim = SandboxSimulation(num_agents=2, grid_size=3, backend="mock", seed=6, debug=True, history_limit=2)
+    sim.reset()
+    results = [await sim.step() for _ in range(6)]
+    retained = [entry for turn in sim.history() for entry in turn["debug"]]
+    records = [sim.read_debug_log(entry["log_offset"]) for entry in retained]
+    expected = [entry for result in results[-2:] for entry in result["debug"]]
+    assert [record["prompt"] for record in records] == [entry["prompt"] for entry in expected]
+    # records of turns that left the history were dropped from disk
+    all_records = sum(
+        len(orjson.dumps({"prompt": entry["prompt"], "response": entry["response"]})) + 1
+        for result in results
+        for entry in result["debug"]
+    )
+    assert 0 < sim._debug_log_compacted_size <= sim._debug_log.seek(0, 2) < all_records
+    await sim.close()
+
+
+@pytest.mark.asyncio
+async def test_history_keeps_prompts_without_debug_log():
+    sim = SandboxSimulation(num_agents=2, grid_size=3, backend="mock", seed=6)
+    sim.reset()
+    result = await sim.step()
+    archived = sim.history()[-1]["debug"][0]
+    assert "log_offset" not in archived
+    assert archived["prompt"] == result["debug"][0]["prompt"]
+    assert archived["response"] == result["debug"][0]["response"]
+
+
+@pytest.mark.asyncio
+async def test_history_view_is_cached_and_sliceable():
+    sim = SandboxSimulation(num_agents=2, grid_size=3, backend="mock", seed=8, history_limit=4)
+    sim.reset()
+    for _ in range(6):
+        await sim.step()
+    assert sim.history() is sim.history()
+    assert [entry["turn"] for entry in sim.history(since_turn=4)] == [5, 6]
+    assert [entry["turn"] for entry in sim.history(since_turn=0)] == [3, 4, 5, 6]
+    await sim.step()
+    assert sim.history()[-1]["turn"] == 7
+
+
+@pytest.mark.asyncio
+async def test_snapshot_delta_reports_moves_and_new_messages():
+    sim = SandboxSimulation(num_agents=3, grid_size=4, backend="mock", seed=12)
+    sim.reset()
+    for _ in range(3):
+        await sim.step()
+    delta = sim.snapshot_delta(1)
+    assert delta["full"] is False and delta["turn"] == 3
+    history = sim.history()
+    before = {entry["name"]: entry["position"] for entry in history[0]["snapshot"]["agents"]}
+    moved = {entry["name"] for entry in delta["agentsMoved"]}
+    assert moved == {agent.name for agent in sim.agents if agent.position != before[agent.name]}
+    assert delta["newMessages"] == [m for m in sim.conversation_log if m["turn"] > 1]
+    assert sim.snapshot_delta(99)["full"] is True
+
+
+def test_controllers_share_one_model_client():
+    sim = SandboxSimulation(num_agents=4, grid_size=4, backend="mock", seed=5)
+    sim.reset()
+    clients = {id(controller._model_client) for controller in sim._controllers.values()}
+    assert clients == {id(sim._model_client)}
+
+
+@pytest.mark.asyncio
+async def test_snapshot_bytes_are_reused_until_the_board_changes():
+    sim = SandboxSimulation(num_agents=3, grid_size=4, backend="mock", seed=8)
+    sim.reset()
+    first = sim.snapshot_bytes()
+    assert sim.snapshot_bytes() is first
+    await sim.step()
+    encoded = sim.snapshot_bytes()
+    assert encoded is not first
+    assert orjson.loads(encoded) == orjson.loads(orjson.dumps(sim.snapshot()))
@@ -0,0 +1,71 @@
+import json
+import sys
+from pathlib import Path
+
+import orjson
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend" / "src"))
+
+from sandbox_simulation import SandboxSimulation, _extract_json_block, _parse_action
+
+
+def test_extract_json_block_returns_first_balanced_object():
+    raw = 'Sure! {"action": "talk", "target": "agent2", "message": "a {curly} hi"} and {"extra": 1}'
+    assert _extract_json_block(raw) == '{"action": "talk", "target": "agent2", "message": "a {curly} hi"}'
+
+
+def test_extract_json_block_handles_nesting_and_escapes():
+    raw = '```json\n{"action": "wait", "meta": {"quote": "\\"}"}}\n```'
+    assert _extract_json_block(raw) == '{"action": "wait", "meta": {"quote": "\\"}"}}'
+
+
+def test_extract_json_block_rejects_unbalanced_input():
+    assert _extract_json_block("no json here") is None
+    assert _extract_json_block('{"action": "move"') is None
+
+
+def test_parse_action_falls_back_to_wait():
+    assert _parse_action("I think I will rest.") == {"action": "wait"}
+    assert _parse_action('{"action": "move", "direction": "sideways"}') == {"action": "wait"}
+    assert _parse_action('{"action": "move", "direction": "up"}') == {"action": "move", "direction": "up"}
+
+
+def test_encode_observation_round_trips():
+    sim = SandboxSimulation(num_agents=3, grid_size=3, backend="mock", seed=2)
+    sim.reset()
+    sim.agents[0].inbox = {"from": "agent2", "message": "こんにちは"}
+    sim._active_turn_debug = []
+    _, observation, encoded, debug_entry = sim._plan_agent(sim.agents[0])
+    assert debug_entry["prompt"] is encoded
+    assert encoded == orjson.dumps(observation).decode("utf-8")
+    assert json.loads(encoded) == observation
+
+
+def test_parse_action_handles_bare_and_wrapped_objects():
+    assert _parse_action('  {"action": "move", "direction": "left"}\n') == {"action": "move", "direction": "left"}
+    # looks like a single object but is two; falls back to the scanner
+    assert _parse_action('{"action": "move", "direction": "up"} {"note": "}"}') == {
+        "action": "move",
+        "direction": "up",
+    }
+
+
+def test_batch_observations_share_positions():
+    sim = SandboxSimulation(num_agents=3, grid_size=3, backend="mock", seed=4)
+    sim.reset()
+    sim._active_turn_debug = []
+    positions = sim._batch_positions()
+    _, first, first_json, _ = sim._plan_agent(sim.agents[0], positions=positions)
+    _, second, second_json, _ = sim._plan_agent(sim.agents[1], positions=positions)
+    assert first["positions"] is second["positions"] is positions
+    assert first_json == orjson.dumps(first).decode("utf-8")
+    assert second_json == orjson.dumps(second).decode("utf-8")
+
+
+def test_observation_traits_leave_personas_to_the_system_prompt():
+    sim = SandboxSimulation(num_agents=3, grid_size=3, backend="mock", seed=3)
+    sim.reset()
+    sim._active_turn_debug = []
+    _, observation, encoded, _ = sim._plan_agent(sim.agents[0])
+    assert observation["traits"] == {name: {"title": p["title"]} for name, p in sim.agent_profiles.items()}
+    assert not any(profile["persona"] in encoded for profile in sim.agent_profiles.values())
@@ -5,6 +5,7 @@ import { resetSimulation, sendPlayerAction, stepSimulation } from "./api";
 import type {
   AgentTrait,
   ConversationEntry,
+  CoordinatorCall,
   DebugEntry,
   PlayerRequest,
   ResetConfig,
@@ -242,6 +243,19 @@ function DebugPanel({ history, themes }: { history: TurnResult[]; themes: ThemeM
       {history.map((entry) => (
         <details key={entry.turn} open>
           <summary>Turn {entry.turn}</summary>
+          {entry.coordinator?.map((call: CoordinatorCall, idx: number) => (
+            <div className="debug-entry" key={`${entry.turn}-coordinator-${idx}`}>
+              <h4>Coordinator call #{idx + 1}</h4>
+              <div className="debug-field">
+                <span className="label">Prompt:</span>
+                <pre>{call.prompt}</pre>
+              </div>
+              <div className="debug-field">
+                <span className="label">Response:</span>
+                <pre>{call.response}</pre>
+              </div>
+            </div>
+          ))}
           {entry.debug.map((debug: DebugEntry, idx: number) => (
             <div className="debug-entry" key={`${entry.turn}-${debug.agent}-${idx}`}>
               <h4>{themes[debug.agent]?.title ?? debug.agent}</h4>
@@ -253,6 +267,12 @@ function DebugPanel({ history, themes }: { history: TurnResult[]; themes: ThemeM
                 <span className="label">Prompt:</span>
                 <pre>{debug.prompt}</pre>
               </div>
+              {debug.coordinator !== undefined && (
+                <div className="debug-field">
+                  <span className="label">Answered by:</span>
+                  <span>Coordinator call #{debug.coordinator + 1}</span>
+                </div>
+              )}
               <div className="debug-field">
                 <span className="label">Response:</span>
                 <pre>{debug.response}</pre>
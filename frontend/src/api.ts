@@ -2,6 +2,15 @@ import type { ResetConfig, ResetResponse, TurnResult } from "./types";
 
 const API_BASE = import.meta.env.VITE_API_URL ?? "http://localhost:8000";
 
+let sessionId: string | null = null;
+
+function sessionQuery(): string {
+  if (!sessionId) {
+    throw new Error("Simulation not initialised. Reset first.");
+  }
+  return `?session_id=${encodeURIComponent(sessionId)}`;
+}
+
 async function request<T>(
   path: string,
   options: RequestInit
@@ -19,6 +28,7 @@ async function request<T>(
 
 export async function resetSimulation(config: ResetConfig): Promise<ResetResponse> {
   const payload = {
+    session_id: sessionId ?? undefined,
     grid_size: config.gridSize,
     num_agents: config.numAgents,
     seed: config.seed ? Number(config.seed) : undefined,
@@ -26,18 +36,20 @@ export async function resetSimulation(config: ResetConfig): Promise<ResetRespons
     backend: config.backend,
     player_agent: config.playerAgent,
   };
-  return request<ResetResponse>("/reset", {
+  const response = await request<ResetResponse>("/reset", {
     method: "POST",
     body: JSON.stringify(payload),
   });
+  sessionId = response.session_id;
+  return response;
 }
 
 export async function stepSimulation(): Promise<TurnResult> {
-  return request<TurnResult>("/step", { method: "POST" });
+  return request<TurnResult>(`/step${sessionQuery()}`, { method: "POST" });
 }
 
 export async function sendPlayerAction(action: Record<string, unknown>): Promise<TurnResult> {
-  return request<TurnResult>("/player_action", {
+  return request<TurnResult>(`/player_action${sessionQuery()}`, {
     method: "POST",
     body: JSON.stringify({ action }),
   });
@@ -53,6 +53,12 @@ export interface DebugEntry {
   legal_actions: LegalAction[];
   action: Record<string, unknown>;
   notes?: string;
+  coordinator?: number;
+}
+
+export interface CoordinatorCall {
+  prompt: string;
+  response: string;
 }
 
 export interface TurnResult {
@@ -60,12 +66,14 @@ export interface TurnResult {
   snapshot: Snapshot;
   turnMessages: ConversationEntry[];
   debug: DebugEntry[];
+  coordinator?: CoordinatorCall[];
   requiresPlayer?: boolean;
   player?: PlayerRequest;
 }
 
 export interface ResetResponse {
   status: string;
+  session_id: string;
   snapshot: Snapshot;
 }
 